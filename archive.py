@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import argparse
+import mmap
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from struct import Struct
+from urllib.parse import quote, unquote
+
+# One record is (timestamp, value) as two little-endian doubles
+RECORD = Struct("<dd")
+PAGE_RECORDS = 256  # 4 KiB pages
+PAGE_SIZE = PAGE_RECORDS * RECORD.size
+SEGMENT_SECONDS = 86400  # one segment file per series and day
+FLUSH_BYTES = 1 << 20
+
+
+def segment_name(segment: int):
+    return f"{segment:08d}.seg"
+
+
+def _doubles(data):
+    values = array("d")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class SeriesWriter:
+    # Appends go to an in-memory buffer; flush() writes whole records to the segment
+    # file and one index entry (first timestamp) for every page that was started
+    __slots__ = ("path", "segment", "count", "last", "_buffer", "_index")
+
+    def __init__(self, path):
+        self.path = path
+        self.segment = None
+        self.count = 0  # records already in the segment file
+        self.last = float("-inf")
+        self._buffer = bytearray()
+        self._index = bytearray()
+
+    def append(self, timestamp: float, value: float):
+        if timestamp < self.last:
+            return False  # index needs timestamps in order
+        segment = int(timestamp // SEGMENT_SECONDS)
+        if segment != self.segment:
+            self.flush()
+            self._open_segment(segment)
+        pending = self.count + len(self._buffer) // RECORD.size
+        if pending % PAGE_RECORDS == 0:
+            self._index += RECORD.pack(timestamp, pending)
+        self._buffer += RECORD.pack(timestamp, value)
+        self.last = timestamp
+        return True
+
+    def pending(self):
+        return len(self._buffer)
+
+    def _open_segment(self, segment):
+        os.makedirs(self.path, exist_ok=True)
+        self.segment = segment
+        data_path = os.path.join(self.path, segment_name(segment))
+        size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        if size % RECORD.size:
+            # Partial record from an interrupted write
+            size -= size % RECORD.size
+            with open(data_path, "r+b") as f:
+                f.truncate(size)
+        self.count = size // RECORD.size
+        if self.count:
+            load_index(data_path, self.count)  # repairs a stale index before appending to it
+            with open(data_path, "rb") as f:
+                f.seek(size - RECORD.size)
+                self.last = max(self.last, RECORD.unpack(f.read(RECORD.size))[0])
+
+    def flush(self):
+        if not self._buffer:
+            return
+        data_path = os.path.join(self.path, segment_name(self.segment))
+        with open(data_path, "ab") as f:
+            f.write(self._buffer)
+        with open(data_path[:-4] + ".idx", "ab") as f:
+            f.write(self._index)
+        self.count += len(self._buffer) // RECORD.size
+        self._buffer = bytearray()
+        self._index = bytearray()
+
+
+def load_index(data_path, count):
+    # Index entries are (first timestamp, record number) per page; rebuilt from the
+    # data file when it doesn't match, e.g. after a crash between the two writes
+    index_path = data_path[:-4] + ".idx"
+    pages = (count + PAGE_RECORDS - 1) // PAGE_RECORDS
+    index = array("d")
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as f:
+            data = f.read()
+        index = _doubles(data[:len(data) - len(data) % RECORD.size])
+    if len(index) == 2 * pages:
+        return index[0::2]
+    starts = array("d")
+    with open(data_path, "rb") as f:
+        for page in range(pages):
+            f.seek(page * PAGE_SIZE)
+            starts.append(RECORD.unpack(f.read(RECORD.size))[0])
+    with open(index_path, "wb") as f:
+        f.write(b"".join(RECORD.pack(t, page * PAGE_RECORDS) for page, t in enumerate(starts)))
+    return starts
+
+
+class ArchiveStore:
+    # Same recording interface as history.HistoryStore, but on disk:
+    # <root>/<charger>/<register>/<socket>/<day>.seg with a sparse .idx next to it
+    def __init__(self, root: str, flush_bytes: int = FLUSH_BYTES):
+        self.root = root
+        self.flush_bytes = flush_bytes
+        self._writers = {}  # (charger, register, socket) -> SeriesWriter
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _series_path(self, charger, register, socket):
+        return os.path.join(self.root, quote(charger, safe=""), quote(register, safe=""), str(socket))
+
+    def record(self, charger, register, socket, value, timestamp=None):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False  # strings and N/A are not kept
+        timestamp = time.time() if timestamp is None else timestamp
+        key = (charger, register, socket)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is None:
+                writer = self._writers[key] = SeriesWriter(self._series_path(*key))
+            if not writer.append(timestamp, value):
+                return False
+            self._pending += RECORD.size
+            if self._pending >= self.flush_bytes:
+                self._flush()
+        return True
+
+    def record_values(self, charger, values, timestamp=None):
+        # values: (register, socket) -> value, as emitted by the poll loop
+        timestamp = time.time() if timestamp is None else timestamp
+        for (register, socket), value in values.items():
+            self.record(charger, register, socket, value, timestamp)
+
+    def _flush(self):
+        for writer in self._writers.values():
+            writer.flush()
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+    def segments(self, charger, register, socket=1):
+        path = self._series_path(charger, register, socket)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(path) if name.endswith(".seg"))
+
+    def range(self, charger, register, socket=1, since=None, until=None):
+        # Samples with since <= timestamp < until; only the pages covering the range are read
+        with self._lock:
+            writer = self._writers.get((charger, register, socket))
+            if writer is not None:
+                self._pending -= writer.pending()
+                writer.flush()
+        path = self._series_path(charger, register, socket)
+        first = None if since is None else int(since // SEGMENT_SECONDS)
+        last = None if until is None else int(until // SEGMENT_SECONDS)
+        times, values = array("d"), array("d")
+        for segment in self.segments(charger, register, socket):
+            if (first is not None and segment < first) or (last is not None and segment > last):
+                continue
+            t, v = self._read_segment(os.path.join(path, segment_name(segment)), since, until)
+            times.extend(t)
+            values.extend(v)
+        return times, values
+
+    def _read_segment(self, data_path, since, until):
+        size = os.path.getsize(data_path)
+        count = size // RECORD.size
+        if not count:
+            return array("d"), array("d")
+        index = load_index(data_path, count)
+        start_page = 0 if since is None else max(bisect_left(index, since) - 1, 0)
+        stop_page = len(index) if until is None else bisect_left(index, until)
+        start = start_page * PAGE_SIZE
+        stop = min(stop_page * PAGE_SIZE, count * RECORD.size)
+        if start >= stop:
+            return array("d"), array("d")
+        with open(data_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            records = _doubles(mm[start:stop])
+        times, values = records[0::2], records[1::2]
+        lo = 0 if since is None else bisect_left(times, since)
+        hi = len(times) if until is None else bisect_left(times, until)
+        return times[lo:hi], values[lo:hi]
+
+    def keys(self):
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for charger in sorted(os.listdir(self.root)):
+            for register in sorted(os.listdir(os.path.join(self.root, charger))):
+                for socket in sorted(os.listdir(os.path.join(self.root, charger, register))):
+                    found.append((unquote(charger), unquote(register), int(socket)))
+        return found
+
+
+def parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the binary register archive")
+    parser.add_argument("root", help="archive directory")
+    parser.add_argument("charger", nargs="?", help="host:port, lists the stored series when omitted")
+    parser.add_argument("register", nargs="?")
+    parser.add_argument("--socket", type=int, default=1)
+    parser.add_argument("--since", type=parse_time, help="ISO date/time or unix timestamp")
+    parser.add_argument("--until", type=parse_time, help="ISO date/time or unix timestamp")
+    args = parser.parse_args()
+
+    store = ArchiveStore(args.root)
+    if args.charger is None or args.register is None:
+        for charger, register, socket in store.keys():
+            print(f"{charger}\t{register}\t{socket}")
+        return
+    times, values = store.range(args.charger, args.register, args.socket, args.since, args.until)
+    for t, v in zip(times, values):
+        print(f"{t:.3f},{v:g}")
+
+
+if __name__ == "__main__":
+    main()
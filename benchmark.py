@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from controller import Controller
+from decoder import decoder_for
+from fleet import Charger, FleetPoller
+from registers import RegisterType, convert_to, load_map
+
+LIVE_REGISTERS = [
+    "Chargepoint State", "Charging State", "Equipment State", "Cable State", "EVSE Fault Code",
+    "Current L1", "Current L2", "Current L3", "Voltage L1", "Voltage L2", "Voltage L3",
+    "Active Power Total", "Active Power L1", "Active Power L2", "Active Power L3", "Meter Reading",
+]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(name, latencies, wall, cpu, alloc_peak):
+    polls = len(latencies)
+    return {
+        "scenario": name,
+        "polls": polls,
+        "polls_per_sec": polls / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "cpu_us_per_poll": cpu / polls * 1e6 if polls else 0.0,
+        "alloc_peak_kib": alloc_peak / 1024.0,
+    }
+
+
+def measure(name, poll, iterations):
+    latencies = []
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(iterations):
+        started = time.perf_counter()
+        poll()
+        latencies.append(time.perf_counter() - started)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    # Allocations are traced in a separate, shorter pass so they don't skew the timings
+    tracemalloc.start()
+    for _ in range(max(iterations // 10, 1)):
+        poll()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(name, latencies, wall, cpu, alloc_peak)
+
+
+def read_single(c, register_map, names):
+    def poll():
+        for name in names:
+            d = register_map[name]
+            if d.reg_type == RegisterType.INPUT:
+                words = c.read_input(d.addr, d.nb)
+            else:
+                words = c.read_holding(d.addr, d.nb)
+            convert_to(d.data_type, words or [], register_map.word_order)
+    return poll
+
+
+def read_dual_socket(c, register_map, names):
+    # Same access pattern as the Read tab on EVC10: socket 1, then socket 2
+    def poll():
+        for name in names:
+            d = register_map[name]
+            for addr in (d.addr, d.socket2_addr):
+                if addr is not None:
+                    convert_to(d.data_type, c.read_input(addr, d.nb) or [], register_map.word_order)
+    return poll
+
+
+def read_blocks(c, register_map, names):
+    blocks = register_map.plan(names)
+
+    def poll():
+        for block in blocks:
+            if block.reg_type == RegisterType.INPUT:
+                data = c.read_input(block.addr, block.nb)
+            else:
+                data = c.read_holding(block.addr, block.nb)
+            if data:
+                decoder_for(block, register_map).decode(data)
+    return poll
+
+
+def read_pipelined(c, register_map, names):
+    blocks = register_map.plan(names)
+
+    def poll():
+        for block, data in zip(blocks, c.read_blocks(blocks)):
+            if data:
+                decoder_for(block, register_map).decode(data)
+    return poll
+
+
+async def measure_fleet(host, base_port, count, model, names, cycles, concurrency):
+    chargers = [Charger(host, base_port + i, model) for i in range(count)]
+    poller = FleetPoller(chargers, names, interval=0, concurrency=concurrency)
+    latencies = []
+
+    async def timed(charger):
+        started = time.perf_counter()
+        result = await poller.poll(charger)
+        if result.error is None:
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(poller.connect(charger) for charger in chargers))
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(cycles):
+        await asyncio.gather(*(timed(charger) for charger in chargers))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    tracemalloc.start()
+    await asyncio.gather(*(poller.poll(charger) for charger in chargers))
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    poller.close()
+    return summarize(f"fleet_{count}_chargers", latencies, wall, cpu, alloc_peak)
+
+
+async def measure_setpoints(host, base_port, count, model, cycles, concurrency):
+    # One sample is a Charging Current update acknowledged by the whole fleet
+    chargers = [Charger(host, base_port + i, model) for i in range(count)]
+    poller = FleetPoller(chargers, interval=0, concurrency=concurrency)
+    latencies = []
+    await asyncio.gather(*(poller.connect(charger) for charger in chargers))
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for cycle in range(cycles):
+        started = time.perf_counter()
+        acks = await poller.write_all(16 + cycle % 16)
+        if all(error is None for error in acks.values()):
+            latencies.append(time.perf_counter() - started)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    tracemalloc.start()
+    await poller.write_all(16)
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    poller.close()
+    return summarize(f"fleet_{count}_setpoints", latencies, wall, cpu, alloc_peak)
+
+
+def start_simulators(host, base_port, count, model):
+    # In their own process, so process_time() and tracemalloc only see the client
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator.py")
+    process = subprocess.Popen([sys.executable, script, "--host", host, "--base-port", str(base_port),
+                                "--count", str(count), "--model", model], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    for port in range(base_port, base_port + count):
+        while True:
+            try:
+                socket.create_connection((host, port), 1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    process.kill()
+                    sys.exit(f"Simulators on {host}:{base_port}-{base_port + count - 1} did not start")
+                time.sleep(0.1)
+    return process
+
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polling throughput and latency benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--external", action="store_true", help="use running servers instead of starting simulators")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--chargers", type=int, default=50, help="chargers for the concurrent fleet scenario")
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--window", type=int, default=4, help="transactions in flight for the pipelined scenario")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    simulators = []
+    if not args.external:
+        simulators.append(start_simulators(args.host, args.port, 1, "EVC10"))
+        simulators.append(start_simulators(args.host, args.port + 1, args.chargers, "EVC04"))
+    try:
+        results = []
+        evc04, evc10 = load_map("EVC04"), load_map("EVC10")
+        c = Controller()
+        if not c.connect(args.host, args.port, 3):
+            sys.exit(f"Unable to connect to {args.host}:{args.port}")
+        results.append(measure("single_register_reads", read_single(c, evc04, LIVE_REGISTERS), args.iterations))
+        results.append(measure("coalesced_block_reads", read_blocks(c, evc04, LIVE_REGISTERS), args.iterations))
+        results.append(measure("dual_socket_reads", read_dual_socket(c, evc10, LIVE_REGISTERS), args.iterations))
+        results.append(measure("dual_socket_block_reads", read_blocks(c, evc10, LIVE_REGISTERS), args.iterations))
+        c.window = args.window
+        results.append(measure("dual_socket_pipelined_reads", read_pipelined(c, evc10, LIVE_REGISTERS), args.iterations))
+        c.disconnect()
+
+        results.append(asyncio.get_event_loop().run_until_complete(measure_fleet(
+            args.host, args.port + 1, args.chargers, "EVC04", LIVE_REGISTERS, args.cycles, args.concurrency)))
+        results.append(asyncio.get_event_loop().run_until_complete(measure_setpoints(
+            args.host, args.port + 1, args.chargers, "EVC04", args.cycles, args.concurrency)))
+
+        report = {
+            "version": git_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "results": results,
+        }
+        print(f"{'scenario':<28}{'polls/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cpu us':>10}{'alloc KiB':>11}")
+        for r in results:
+            print(f"{r['scenario']:<28}{r['polls_per_sec']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+                  f"{r['p99_ms']:>10.2f}{r['cpu_us_per_poll']:>10.0f}{r['alloc_peak_kib']:>11.1f}")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        for process in simulators:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
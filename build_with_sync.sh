@@ -5,6 +5,24 @@ echo ">>> PyInstaller derleme başlatılıyor..."
 pyinstaller --clean --onefile --noconsole \
 --hidden-import pymodbus.client.sync \
 --add-data "controller.py:." \
+--add-data "io_worker.py:." \
+--add-data "heartbeat.py:." \
+--add-data "reconnect.py:." \
+--add-data "pipeline.py:." \
+--add-data "read_planner.py:." \
+--add-data "registers.py:." \
+--add-data "worker.py:." \
+--add-data "dashboard.py:." \
+--add-data "trend.py:." \
+--add-data "scheduler.py:." \
+--add-data "cache.py:." \
+--add-data "decoder.py:." \
+--add-data "metrics.py:." \
+--add-data "capture.py:." \
+--add-data "server.py:." \
+--add-data "events.py:." \
+--add-data "history.py:." \
+--add-data "maps:maps" \
 --add-data "window.ui:." \
 --add-data "__init__.py:." \
 modbus-gui.py
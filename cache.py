@@ -0,0 +1,36 @@
+import threading
+import time
+
+
+class RegisterCache:
+    def __init__(self):
+        self._entries = {}  # (reg_type, addr, nb) -> (expires_at, words)
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, words = entry
+            if (time.monotonic() if now is None else now) >= expires_at:
+                del self._entries[key]
+                return None
+            return list(words)
+
+    def put(self, key, words, ttl, now=None):
+        if not ttl:
+            return
+        expires_at = (time.monotonic() if now is None else now) + ttl
+        with self._lock:
+            self._entries[key] = (expires_at, tuple(words))
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+import argparse
+import mmap
+import struct
+import sys
+import threading
+import time
+from struct import Struct
+
+from cache import RegisterCache
+from metrics import registry
+from registers import RegisterType, convert_to, load_map
+
+MAGIC = b"EVCCAP1\n"
+# timestamp, transaction sequence, kind, PDU length; the PDU follows
+RECORD = Struct("<dIBH")
+REQUEST, RESPONSE, NO_RESPONSE = 0, 1, 2
+FLUSH_RECORDS = 256
+
+FC_REG_TYPES = {3: RegisterType.HOLDING, 4: RegisterType.INPUT}
+
+
+def request_pdu(fc, addr, arg):
+    if fc == 16:
+        return struct.pack(f">BHHB{len(arg)}H", fc, addr, len(arg), 2 * len(arg), *arg)
+    return struct.pack(">BHH", fc, addr, arg)
+
+
+def response_pdu(fc, result):
+    if result.isError():
+        return struct.pack(">BB", fc | 0x80, getattr(result, "exception_code", 0) or 0)
+    if fc in FC_REG_TYPES:
+        words = result.registers
+        return struct.pack(f">BB{len(words)}H", fc, 2 * len(words), *words)
+    if fc == 6:
+        return struct.pack(">BHH", fc, result.address, result.value)
+    return struct.pack(">BHH", fc, result.address, result.count)
+
+
+class CaptureWriter:
+    # Every request/response PDU with a wall clock timestamp; records are buffered
+    # and written in batches so capturing doesn't slow down the I/O thread
+    def __init__(self, path: str, flush_records: int = FLUSH_RECORDS):
+        self.path = path
+        self.flush_records = flush_records
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._buffer = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _append(self, seq, kind, pdu):
+        self._buffer.append(RECORD.pack(time.time(), seq, kind, len(pdu)) + pdu)
+        if len(self._buffer) >= self.flush_records:
+            self._flush()
+
+    def request(self, fc, addr, arg):
+        with self._lock:
+            self._seq += 1
+            self._append(self._seq, REQUEST, request_pdu(fc, addr, arg))
+            return self._seq
+
+    def response(self, seq, fc, result):
+        with self._lock:
+            if result is None or type(result).__name__ == "ModbusIOException":
+                self._append(seq, NO_RESPONSE, bytes([fc]))
+            else:
+                self._append(seq, RESPONSE, response_pdu(fc, result))
+
+    def _flush(self):
+        self._file.write(b"".join(self._buffer))
+        self._file.flush()
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+
+
+def read_capture(path):
+    # Yields (timestamp, seq, kind, pdu); a truncated last record is ignored
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        f.seek(0, 2)
+        if f.tell() == len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset, size = len(MAGIC), len(mm)
+            while offset + RECORD.size <= size:
+                timestamp, seq, kind, length = RECORD.unpack_from(mm, offset)
+                offset += RECORD.size
+                if offset + length > size:
+                    break
+                yield timestamp, seq, kind, mm[offset:offset + length]
+                offset += length
+
+
+def transactions(path):
+    # Pairs requests with their responses: (timestamp, reg_type, addr, words) for
+    # every successful register read, in capture order
+    pending = {}
+    for timestamp, seq, kind, pdu in read_capture(path):
+        if kind == REQUEST:
+            if pdu[0] in FC_REG_TYPES:
+                pending[seq] = struct.unpack_from(">BHH", pdu)
+            continue
+        request = pending.pop(seq, None)
+        if request is None or kind != RESPONSE or pdu[0] & 0x80:
+            continue
+        fc, addr, count = request
+        words = struct.unpack_from(f">{pdu[1] // 2}H", pdu, 2)
+        if len(words) == count:
+            yield timestamp, FC_REG_TYPES[fc], addr, words
+
+
+class CaptureDecoder:
+    # Same path as the live poll: slice the response words per register and convert_to
+    def __init__(self, register_map):
+        self.register_map = register_map
+        self._layouts = {}  # (reg_type, addr, count) -> [(key, offset, nb, data_type)]
+
+    def layout(self, reg_type, addr, count):
+        key = (reg_type, addr, count)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = []
+            for offset in range(count):
+                found = self.register_map.by_addr.get((reg_type, addr + offset))
+                if found is None:
+                    continue
+                d, socket = found
+                if offset + d.nb <= count:
+                    layout.append(((d.name, socket), offset, d.nb, d.data_type))
+        return layout
+
+    def decode(self, reg_type, addr, words):
+        return {
+            key: convert_to(data_type, words[offset:offset + nb], self.register_map.word_order)
+            for key, offset, nb, data_type in self.layout(reg_type, addr, len(words))
+        }
+
+
+def replay(path, register_map, speed: float = 0):
+    # Yields (timestamp, {(name, socket): text}); speed 0 replays as fast as possible
+    decoder = CaptureDecoder(register_map)
+    started = first = None
+    for timestamp, reg_type, addr, words in transactions(path):
+        if speed:
+            if first is None:
+                started, first = time.monotonic(), timestamp
+            delay = (timestamp - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        values = decoder.decode(reg_type, addr, words)
+        if values:
+            yield timestamp, values
+
+
+class ReplayController:
+    # Stands in for Controller: reads are answered from the register image the capture
+    # had reached on the replay clock, so the GUI sees the recorded session
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.cache = RegisterCache()
+        self.metrics = registry.connection(f"replay:{path}")
+        self._image = {}  # (reg_type, addr) -> word
+        self._records = None
+        self._next = None
+        self._first = None
+        self._started = None
+
+    def connect(self, host=None, port=None, timeout=None):
+        self._image.clear()
+        self.cache.invalidate()
+        self._records = transactions(self.path)
+        self._next = next(self._records, None)
+        self._first = self._next[0] if self._next is not None else 0.0
+        self._started = time.monotonic()
+        return True
+
+    def disconnect(self):
+        self._records = None
+        self.cache.invalidate()
+
+    def refresh(self):
+        self.cache.invalidate()
+
+    def is_connected(self):
+        return self._records is not None
+
+    def _advance(self):
+        now = self._first + (time.monotonic() - self._started) * self.speed
+        while self._next is not None and self._next[0] <= now:
+            _, reg_type, addr, words = self._next
+            for i, word in enumerate(words):
+                self._image[(reg_type, addr + i)] = word
+            self._next = next(self._records, None)
+
+    def _read(self, reg_type, addr, length):
+        if self._records is None:
+            return None
+        self._advance()
+        words = [self._image.get((reg_type, addr + i)) for i in range(length)]
+        return None if None in words else words
+
+    def read_input(self, addr, length, timeout=None, ttl=None):
+        return self._read(RegisterType.INPUT, addr, length)
+
+    def read_holding(self, addr, length, timeout=None, ttl=None):
+        return self._read(RegisterType.HOLDING, addr, length) or []
+
+    def write(self, addr, data, timeout=None):
+        print(f"[ERROR] Write to addr {addr} ignored while replaying {self.path}")
+        return None
+
+    def write_many(self, addr, values, timeout=None):
+        return self.write(addr, values, timeout)
+
+    def write_batch(self, writes, timeout=None):
+        return {addr: self.write(addr, values, timeout) for addr, values in writes.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a Modbus capture file")
+    parser.add_argument("capture")
+    parser.add_argument("--model", default="EVC04")
+    parser.add_argument("--speed", type=float, default=0, help="1 for real time, 0 for as fast as possible")
+    parser.add_argument("--quiet", action="store_true", help="only print totals")
+    args = parser.parse_args()
+
+    register_map = load_map(args.model)
+    started = time.perf_counter()
+    samples = span_start = span_end = 0
+    for timestamp, values in replay(args.capture, register_map, args.speed):
+        span_start = span_start or timestamp
+        span_end = timestamp
+        samples += len(values)
+        if not args.quiet:
+            for (name, socket), text in values.items():
+                print(f"{timestamp:.3f},{name},{socket},{text}")
+    elapsed = time.perf_counter() - started
+    print(f"{samples} values, {span_end - span_start:.0f} s of traffic replayed in {elapsed:.2f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,418 @@
-import threading
-
-from PyQt5.QtCore import qDebug
 from pymodbus.client.sync import ModbusTcpClient
 import argparse
+import asyncio
+import sys
+import threading
 import time
 
+import heartbeat
+from cache import RegisterCache
+from io_worker import IoWorker, PRIORITY_ALIVE, PRIORITY_READ, PRIORITY_WRITE
+from metrics import MetricsServer, registry
+from pipeline import DEFAULT_WINDOW, pipeline
+from reconnect import (CONNECTED, CONNECTING, DISCONNECTED, FAILURES_BEFORE_RECONNECT, RECONNECTING,
+                       is_link_error, reconnect_delay)
+from registers import DEFAULT_UNIT, RegisterType, registers
+
 
 class Controller:
     def __init__(self):
         self._client = ModbusTcpClient()
+        # All socket traffic goes through this single worker
+        self._worker = IoWorker()
+        self._worker.start()
+        self.cache = RegisterCache()
+        self.metrics = registry.connection()
+        self.capture = None
+        self.window = DEFAULT_WINDOW  # outstanding transactions allowed by the device
+        self.unit = DEFAULT_UNIT  # set from the register map, same as the fleet poller uses
+        self.state = DISCONNECTED
+        self.auto_reconnect = True
+        self._listeners = []
+        self._failures = 0  # consecutive failed transactions
+        self._attempt = 0
+        self._reconnect_timer = None
+        self._state_lock = threading.Lock()
+
+    def add_state_listener(self, callback):
+        # callback(state, detail) is called from whichever thread changed the state
+        self._listeners.append(callback)
+
+    def remove_state_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _set_state(self, state, detail=""):
+        with self._state_lock:
+            if self.state == state and not detail:
+                return
+            self.state = state
+        for callback in list(self._listeners):
+            try:
+                callback(state, detail)
+            except Exception as e:
+                print(f"[ERROR] Connection state listener failed: {e}")
+
+    def record(self, path: str):
+        from capture import CaptureWriter
+
+        self.stop_recording()
+        self.capture = CaptureWriter(path)
+
+    def stop_recording(self):
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.close()
 
     def connect(self, host: str, port: int, timeout: int):
         self._client.host = host
         self._client.port = port
         self._client.timeout = timeout
-        result = self._client.connect()
-        alive_thread = threading.Thread(target=self.start_alive, daemon=True)
-        if not alive_thread.is_alive():
-            alive_thread.start()
+        self.metrics.label = f"{host}:{port}"
+        self._cancel_reconnect()
+        self.cache.invalidate()
+        self._set_state(CONNECTING)
+        result = self._worker.submit(self._client.connect, priority=PRIORITY_WRITE).result()
+        self._failures = 0
+        self._set_state(CONNECTED if result else DISCONNECTED)
+        if result:
+            self.start_alive()
         return result
 
     def disconnect(self):
-        self._client.close()
+        self._cancel_reconnect()
+        self._set_state(DISCONNECTED)
+        heartbeat.scheduler.unregister(self)
+        self.cache.invalidate()
+        self._worker.submit(self._client.close, priority=PRIORITY_WRITE).result()
+
+    def refresh(self):
+        self.cache.invalidate()
 
     def is_connected(self):
-        return self._client.is_socket_open()
+        return self.state == CONNECTED and self._client.is_socket_open()
+
+    def _link_failed(self, error=None):
+        # Runs on the I/O worker thread after a failed transaction
+        self._failures += 1
+        if self.state != CONNECTED or not self.auto_reconnect:
+            return
+        if (error is not None and is_link_error(error)) or self._failures >= FAILURES_BEFORE_RECONNECT \
+                or not self._client.is_socket_open():
+            heartbeat.scheduler.unregister(self)
+            self._client.close()
+            self.cache.invalidate()
+            self._attempt = 0
+            self._set_state(RECONNECTING, str(error or "no response"))
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        delay = reconnect_delay(self._attempt)
+        timer = threading.Timer(delay, self._reconnect)
+        timer.daemon = True
+        with self._state_lock:
+            if self.state != RECONNECTING:
+                return
+            self._reconnect_timer = timer
+        timer.start()
+
+    def _cancel_reconnect(self):
+        with self._state_lock:
+            timer, self._reconnect_timer = self._reconnect_timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def _reconnect(self):
+        # Background attempt; the poll loop and heartbeat resume once it succeeds
+        if self.state != RECONNECTING:
+            return
+        self._attempt += 1
+        try:
+            result = self._worker.submit(self._client.connect, priority=PRIORITY_WRITE).result()
+        except Exception:
+            result = False
+        if self.state != RECONNECTING:
+            return
+        if result:
+            self._failures = 0
+            self._set_state(CONNECTED, f"reconnected after {self._attempt} attempt(s)")
+            self.start_alive()
+        else:
+            self._set_state(RECONNECTING, f"attempt {self._attempt} failed")
+            self._schedule_reconnect()
 
     def start_alive(self):
-        while self._client.is_socket_open():
-            self._client.write_register(6000, 1)
-            time.sleep(1)
+        # Driven by the shared heartbeat thread, at a rate set by the charger's Failsafe Timeout
+        timeout = self.read_holding(registers["Failsafe Timeout"].addr, 1)
+        heartbeat.scheduler.register(self, self._send_alive, heartbeat.alive_interval(timeout[0] if timeout else None))
+
+    def _send_alive(self):
+        if not self._client.is_socket_open():
+            return False
+        self.write_async(registers["Alive Register"].addr, 1, priority=PRIORITY_ALIVE, timeout=1)
+
+    def _failsafe_written(self, addr, values):
+        failsafe = registers["Failsafe Timeout"].addr
+        if addr <= failsafe < addr + len(values):
+            heartbeat.scheduler.set_interval(self, heartbeat.alive_interval(values[failsafe - addr]))
+
+    def _transaction(self, fc, func, addr, arg, count):
+        # Runs on the I/O worker thread, so timing covers only the wire round-trip
+        if self.state == RECONNECTING:
+            # Fail fast instead of letting the client block on its own connect attempt
+            raise ConnectionError("Connection lost, reconnecting")
+        capture = self.capture
+        seq = capture.request(fc, addr, arg) if capture is not None else None
+        started = time.perf_counter()
+        try:
+            result = func(addr, arg, unit=self.unit)
+        except Exception as e:
+            self.metrics.observe(fc, addr, count, time.perf_counter() - started, error=e)
+            if capture is not None:
+                capture.response(seq, fc, None)
+            self._link_failed(e)
+            raise
+        self.metrics.observe(fc, addr, count, time.perf_counter() - started, result=result)
+        if capture is not None:
+            capture.response(seq, fc, result)
+        if result is None or type(result).__name__ == "ModbusIOException":
+            self._link_failed()
+        else:
+            self._failures = 0
+        return result
+
+    def _pipeline(self, requests):
+        # Runs on the I/O worker thread, like _transaction, but keeps up to self.window
+        # requests outstanding on the client's socket
+        if self.state == RECONNECTING:
+            raise ConnectionError("Connection lost, reconnecting")
+        sock = self._client.socket
+        if sock is None:
+            raise ConnectionError("Not connected")
+        capture = self.capture
+        started, seqs, answered = {}, {}, set()
+
+        def sent(i):
+            started[i] = time.perf_counter()
+            if capture is not None:
+                seqs[i] = capture.request(*requests[i])
+
+        def received(i, response):
+            answered.add(i)
+            fc, addr, count = requests[i]
+            self.metrics.observe(fc, addr, count, time.perf_counter() - started[i], result=response)
+            if capture is not None:
+                capture.response(seqs[i], fc, response)
 
-    def read_input(self, addr, length):
-        result = self._client.read_input_registers(addr, length)
+        try:
+            # Tids come from the client's own counter so they can't collide with its requests
+            results = pipeline(sock, requests, self.window, self._client.timeout, self.unit,
+                               next_tid=self._client.transaction.getNextTID, sent=sent, received=received)
+        except Exception as e:
+            for i in set(started) - answered:
+                fc, addr, count = requests[i]
+                self.metrics.observe(fc, addr, count, time.perf_counter() - started[i], error=e)
+                if capture is not None:
+                    capture.response(seqs[i], fc, None)
+            # Responses may still be on their way; the stream can't be trusted any more
+            self._client.close()
+            self._link_failed(ConnectionError(str(e) or type(e).__name__))
+            raise
+        self._failures = 0
+        return results
+
+    def read_blocks(self, blocks, timeout=None):
+        # Words of every ReadBlock (None where it failed), pipelined on one connection
+        requests = [(4 if block.reg_type == RegisterType.INPUT else 3, block.addr, block.nb) for block in blocks]
+        try:
+            results = self._worker.submit(self._pipeline, requests, priority=PRIORITY_READ, timeout=timeout).result()
+        except Exception as e:
+            print(f"[ERROR] Failed to read {len(blocks)} blocks: {e}")
+            return [None] * len(blocks)
+        words = []
+        for block, result in zip(blocks, results):
+            if result is None or result.isError() or len(result.registers) < block.nb:
+                print(f"[ERROR] Failed to read {block.nb} registers from addr {block.addr}: {result}")
+                words.append(None)
+            else:
+                words.append(result.registers)
+        return words
+
+    def read_input_async(self, addr, length, priority=PRIORITY_READ, timeout=None):
+        return self._worker.submit(self._transaction, 4, self._client.read_input_registers, addr, length, length,
+                                   priority=priority, timeout=timeout)
+
+    def read_holding_async(self, addr, length, priority=PRIORITY_READ, timeout=None):
+        return self._worker.submit(self._transaction, 3, self._client.read_holding_registers, addr, length, length,
+                                   priority=priority, timeout=timeout)
+
+    def write_async(self, addr, data, priority=PRIORITY_WRITE, timeout=None):
+        return self._worker.submit(self._transaction, 6, self._client.write_register, addr, data, 1,
+                                   priority=priority, timeout=timeout)
+
+    def write_multiple_async(self, addr, values, priority=PRIORITY_WRITE, timeout=None):
+        values = list(values)
+        return self._worker.submit(self._transaction, 16, self._client.write_registers, addr, values, len(values),
+                                   priority=priority, timeout=timeout)
+
+    def read_input(self, addr, length, timeout=None, ttl=None):
+        key = (RegisterType.INPUT, addr, length)
+        if ttl:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            result = self.read_input_async(addr, length, timeout=timeout).result()
+        except Exception as e:
+            print(f"[ERROR] Failed to read input registers from addr {addr}: {e}")
+            return None
         if result is None:
             print(f"[ERROR] No response from address {addr}")
             return None
         if not hasattr(result, "registers"):
             print(f"[ERROR] Result at {addr} has no 'registers'")
             return None
+        self.cache.put(key, result.registers, ttl)
         return result.registers
 
 
-    def write(self, addr, data):
-        self._client.write_register(addr, data)
+    def write(self, addr, data, timeout=None):
+        self.cache.invalidate((RegisterType.HOLDING, addr, 1))
+        result = self.write_async(addr, data, timeout=timeout).result()
+        self._failsafe_written(addr, [data])
+        return result
+
+    def write_many(self, addr, values, timeout=None):
+        # One FC16 request for a multi-word value
+        values = list(values)
+        self.cache.invalidate((RegisterType.HOLDING, addr, len(values)))
+        result = self.write_multiple_async(addr, values, timeout=timeout).result()
+        self._failsafe_written(addr, values)
+        return result
+
+    def write_batch(self, writes, timeout=None):
+        # writes: {addr: [words]}; contiguous writes are merged into one FC16 request,
+        # a lone single word still goes out as FC6. Returns {addr: result}
+        words = {}
+        for addr, values in writes.items():
+            for i, word in enumerate(values):
+                words[addr + i] = word
+        runs = []
+        for addr in sorted(words):
+            if runs and runs[-1][0] + len(runs[-1][1]) == addr:
+                runs[-1][1].append(words[addr])
+            else:
+                runs.append((addr, [words[addr]]))
+        for addr, values in writes.items():
+            self.cache.invalidate((RegisterType.HOLDING, addr, len(values)))
+        futures = [
+            (addr, values, self.write_async(addr, values[0], timeout=timeout) if len(values) == 1
+             else self.write_multiple_async(addr, values, timeout=timeout))
+            for addr, values in runs
+        ]
+        results = {}
+        for run_addr, values, future in futures:
+            result = future.result()
+            for addr in writes:
+                if run_addr <= addr < run_addr + len(values):
+                    results[addr] = result
+            self._failsafe_written(run_addr, values)
+        return results
 
-    def read_holding(self, addr, length):
-        result = self._client.read_holding_registers(addr, length)
+    def read_holding(self, addr, length, timeout=None, ttl=None):
+        key = (RegisterType.HOLDING, addr, length)
+        if ttl:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            result = self.read_holding_async(addr, length, timeout=timeout).result()
+        except Exception as e:
+            print(f"[ERROR] Failed to read holding registers from addr {addr}: {e}")
+            return []
         if result is None or not hasattr(result, "registers"):
             print(f"[ERROR] Failed to read holding registers from addr {addr}")
             return []
+        self.cache.put(key, result.registers, ttl)
         return result.registers
 
+
+def parse_charger(text, model):
+    host, _, port = text.partition(":")
+    return host, int(port) if port else 502, model
+
+
+async def poll_to_writer(poller, writer, count=None, archive=None, changes=None):
+    from export import event_rows, poll_rows
+
+    polled = 0
+    async for result in poller.stream():
+        if result.error is not None:
+            print(f"[ERROR] {result.charger.key}: {result.error}", file=sys.stderr)
+        else:
+            if changes is not None:
+                writer.write_many(event_rows(changes.feed(result.charger.key, result.values, result.timestamp)))
+            else:
+                writer.write_many(poll_rows(result))
+            if archive is not None:
+                archive.record_values(result.charger.key, result.values, result.timestamp)
+        polled += 1
+        if count is not None and polled >= count:
+            break
+
+
+def main():
+    # Headless polling, no Qt required
+    from archive import ArchiveStore
+    from export import DEFAULT_BATCH, WRITERS
+    from fleet import Charger, FleetPoller
+    from events import ChangeStream
+    from registers import available_models, load_map
+
+    parser = argparse.ArgumentParser(description="Poll EVC chargers over Modbus TCP and export the values")
+    parser.add_argument("chargers", nargs="+", help="host or host:port of each charger")
+    parser.add_argument("--model", default="EVC04", choices=available_models())
+    parser.add_argument("--registers", help="comma separated register names, default is the whole map")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between polls")
+    parser.add_argument("--count", type=int, help="stop after this many charger polls")
+    parser.add_argument("--timeout", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--format", default="csv", choices=sorted(WRITERS))
+    parser.add_argument("--output", default="-", help="output file, '-' for stdout")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="rows buffered per write")
+    parser.add_argument("--rotate-mb", type=float, default=0, help="start a new file after this many MB")
+    parser.add_argument("--rotate-minutes", type=float, default=0, help="start a new file after this many minutes")
+    parser.add_argument("--changes-only", action="store_true",
+                        help="only export values that changed beyond the register deadband")
+    parser.add_argument("--max-silence", type=float, default=300.0,
+                        help="with --changes-only, repeat unchanged values after this many seconds")
+    parser.add_argument("--archive", help="also keep numeric values in this binary archive directory")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="reads kept in flight per charger; 1 for devices that can't queue requests")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:<port>/metrics")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.registers.split(",")] if args.registers else None
+    unknown = [name for name in names or () if name not in load_map(args.model).by_name]
+    if unknown:
+        parser.error(f"unknown register(s) for {args.model}: {', '.join(unknown)}")
+    chargers = [Charger(*parse_charger(text, args.model), window=args.window) for text in args.chargers]
+    poller = FleetPoller(chargers, names, args.interval, args.concurrency, args.timeout)
+    writer = WRITERS[args.format](args.output, args.batch, int(args.rotate_mb * 1024 * 1024), args.rotate_minutes * 60)
+    archive = ArchiveStore(args.archive) if args.archive else None
+    changes = ChangeStream(load_map(args.model), args.max_silence) if args.changes_only else None
+    if args.metrics_port:
+        MetricsServer(args.metrics_port).start()
+    try:
+        asyncio.get_event_loop().run_until_complete(poll_to_writer(poller, writer, args.count, archive, changes))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if archive is not None:
+            archive.close()
+        writer.close()
+        poller.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer, pyqtSlot
+
+MAX_REPAINTS_PER_SECOND = 10
+
+
+class RegisterTableModel(QAbstractTableModel):
+    COLUMNS = ("Register", "Socket 1", "Socket 2")
+
+    def __init__(self, register_map, max_fps: int = MAX_REPAINTS_PER_SECOND, parent=None):
+        super().__init__(parent)
+        self._pending = {}
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(int(1000 / max_fps))
+        self._flush_timer.timeout.connect(self.flush)
+        self.set_register_map(register_map)
+
+    def set_register_map(self, register_map):
+        self.beginResetModel()
+        self.register_map = register_map
+        self._names = list(register_map)
+        self._rows = {name: row for row, name in enumerate(self._names)}
+        self._values = {}  # (name, socket) -> text
+        self._pending.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._names)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        name = self._names[index.row()]
+        if index.column() == 0:
+            return name
+        return self._values.get((name, index.column()), "")
+
+    @pyqtSlot(dict)
+    def update_values(self, values):
+        # Only keep cells whose text changed; repaints are coalesced by the flush timer
+        for key, text in values.items():
+            if key[0] in self._rows and self._values.get(key) != text:
+                self._pending[key] = text
+        if self._pending and not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    @pyqtSlot()
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        changed = []
+        for key, text in pending.items():
+            if self._values.get(key) != text:
+                self._values[key] = text
+                changed.append((self._rows[key[0]], key[1]))
+
+        # Emit one dataChanged per run of adjacent rows in the same column
+        changed.sort(key=lambda cell: (cell[1], cell[0]))
+        start = None
+        for i, (row, column) in enumerate(changed):
+            if start is None:
+                start = row
+            next_cell = changed[i + 1] if i + 1 < len(changed) else None
+            if next_cell is None or next_cell != (row + 1, column):
+                self.dataChanged.emit(self.index(start, column), self.index(row, column), [Qt.DisplayRole])
+                start = None
+
+    def clear(self):
+        self.beginResetModel()
+        self._values = {}
+        self._pending.clear()
+        self.endResetModel()
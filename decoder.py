@@ -0,0 +1,110 @@
+import struct
+import sys
+from array import array
+from weakref import WeakKeyDictionary
+
+from registers import DataType
+
+WORD_ORDER_BIG = "big"  # high word first, as sent by EVC04/EVC10
+WORD_ORDER_LITTLE = "little"
+
+_FIELD_UINT16 = 0
+_FIELD_UINT32 = 1
+_FIELD_UINT32_SWAPPED = 2
+_FIELD_STRING = 3
+
+
+def words_to_bytes(words):
+    # Registers as big-endian bytes, without building per-register objects
+    raw = array("H", words)
+    if sys.byteorder == "little":
+        raw.byteswap()
+    return raw.tobytes()
+
+
+def format_value(data_type, value):
+    if data_type == DataType.UINT16 and isinstance(value, tuple):
+        return " ".join(str(x) for x in value)
+    return str(value)
+
+
+class BlockDecoder:
+    def __init__(self, block, types, word_order=WORD_ORDER_BIG):
+        # types: key -> DataType for every entry of the block
+        fmt = [">"]
+        self._fields = []
+        offset = block.addr
+        for key, addr, nb in sorted(block.entries, key=lambda entry: entry[1]):
+            if addr < offset:
+                raise ValueError(f"Overlapping registers at addr {addr} in {block!r}")
+            if addr > offset:
+                fmt.append(f"{(addr - offset) * 2}x")
+            data_type = types[key]
+            if data_type == DataType.STRING:
+                fmt.append(f"{nb * 2}s")
+                self._fields.append((key, _FIELD_STRING, 1))
+            elif data_type == DataType.UINT32 and nb == 2:
+                if word_order == WORD_ORDER_BIG:
+                    fmt.append("I")
+                    self._fields.append((key, _FIELD_UINT32, 1))
+                else:
+                    fmt.append("2H")
+                    self._fields.append((key, _FIELD_UINT32_SWAPPED, 2))
+            else:
+                fmt.append(f"{nb}H")
+                self._fields.append((key, _FIELD_UINT16, nb))
+            offset = addr + nb
+        if offset < block.end():
+            fmt.append(f"{(block.end() - offset) * 2}x")
+        self.block = block
+        self.types = types
+        self._struct = struct.Struct("".join(fmt))
+
+    @property
+    def size(self):
+        return self._struct.size
+
+    def _collect(self, items):
+        values = {}
+        i = 0
+        for key, kind, count in self._fields:
+            if kind == _FIELD_STRING:
+                values[key] = items[i].decode("utf-16-be", "surrogatepass")
+            elif kind == _FIELD_UINT32:
+                values[key] = items[i]
+            elif kind == _FIELD_UINT32_SWAPPED:
+                values[key] = items[i] | (items[i + 1] << 16)
+            elif count == 1:
+                values[key] = items[i]
+            else:
+                values[key] = tuple(items[i:i + count])
+            i += count
+        return values
+
+    def decode(self, words):
+        return self._collect(self._struct.unpack(words_to_bytes(words)))
+
+    def decode_bytes(self, buffer, offset=0):
+        return self._collect(self._struct.unpack_from(buffer, offset))
+
+    def decode_many(self, responses):
+        # Stack the responses of many chargers into one buffer and unpack them in a single pass
+        buffer = bytearray()
+        for words in responses:
+            buffer += words_to_bytes(words)
+        return [self._collect(items) for items in self._struct.iter_unpack(buffer)]
+
+    def decode_text(self, words):
+        return {key: format_value(self.types[key], value) for key, value in self.decode(words).items()}
+
+
+_decoders = WeakKeyDictionary()
+
+
+def decoder_for(block, register_map):
+    # Blocks come from the map's cached plans, so one decoder per block is enough
+    decoder = _decoders.get(block)
+    if decoder is None:
+        types = {key: register_map[key[0]].data_type for key, _, _ in block.entries}
+        decoder = _decoders[block] = BlockDecoder(block, types, register_map.word_order)
+    return decoder
@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+DEFAULT_MAX_SILENCE = 300.0  # republish unchanged values at least this often
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class ChangeEvent(NamedTuple):
+    timestamp: float
+    source: str  # charger key, host:port
+    register: str
+    socket: int
+    value: str
+    previous: Optional[str]  # last published value, None for the first one
+    heartbeat: bool = False  # value within the deadband, sent anyway after max_silence
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+class ChangeFilter:
+    # Turns polled samples into change events. Values are compared against the last
+    # *published* value, so slow drift still comes through once it leaves the deadband.
+    # Registers without a deadband (states, codes, strings) publish on every change.
+    def __init__(self, register_map=None, max_silence: float = DEFAULT_MAX_SILENCE, deadbands=None):
+        self.max_silence = max_silence
+        self.deadbands = {}  # register -> (absolute, percent)
+        if register_map is not None:
+            for d in register_map.defs:
+                if d.deadband is not None:
+                    self.deadbands[d.name] = d.deadband
+        self.deadbands.update(deadbands or {})
+        self._last = {}  # (source, register, socket) -> (text, number, published_at)
+        self._lock = threading.Lock()
+
+    def _outside(self, register, number, last_number):
+        band = self.deadbands.get(register)
+        if band is None or number is None or last_number is None:
+            return True
+        absolute, percent = band
+        return abs(number - last_number) > max(absolute, abs(last_number) * percent / 100.0)
+
+    def changes(self, source, values, timestamp=None):
+        # values: (register, socket) -> text, as emitted by the poll loop
+        timestamp = time.time() if timestamp is None else timestamp
+        events = []
+        with self._lock:
+            for (register, socket), value in values.items():
+                key = (source, register, socket)
+                last = self._last.get(key)
+                heartbeat = False
+                if last is not None:
+                    last_value, last_number, published_at = last
+                    if value == last_value or not self._outside(register, _number(value), last_number):
+                        if timestamp - published_at < self.max_silence:
+                            continue
+                        # Send what was read now, not the old reference, and use it as
+                        # the new reference: a drift hidden by the deadband shows up here
+                        heartbeat = True
+                self._last[key] = (value, _number(value), timestamp)
+                events.append(ChangeEvent(timestamp, source, register, socket, value,
+                                          last[0] if last is not None else None, heartbeat))
+        return events
+
+    def latest(self, source=None):
+        # Last published value of every register: {(source, register, socket): text}
+        with self._lock:
+            return {key: state[0] for key, state in self._last.items() if source is None or key[0] == source}
+
+    def forget(self, source=None):
+        with self._lock:
+            if source is None:
+                self._last.clear()
+            else:
+                for key in [k for k in self._last if k[0] == source]:
+                    del self._last[key]
+
+
+class EventQueue:
+    # Bounded buffer for a subscriber that consumes on its own thread; when it falls
+    # behind the oldest events are dropped and counted instead of blocking the poller
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_SIZE):
+        self._events = deque(maxlen=maxsize)
+        self._ready = threading.Condition()
+        self.dropped = 0
+
+    def __call__(self, events):
+        with self._ready:
+            overflow = len(self._events) + len(events) - self._events.maxlen
+            if overflow > 0:
+                self.dropped += min(overflow, len(self._events) + len(events))
+            self._events.extend(events)
+            self._ready.notify_all()
+
+    def get(self, timeout=None):
+        # All queued events, waiting up to timeout for at least one
+        with self._ready:
+            if not self._events:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class EventBus:
+    # In-process pub/sub; subscribers are called with a list of ChangeEvent on the
+    # publishing thread, so they must be quick (use an EventQueue otherwise)
+    def __init__(self):
+        self._subscribers = {}  # token -> (callback, registers, sources)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, registers=None, sources=None):
+        registers = frozenset(registers) if registers is not None else None
+        sources = frozenset(sources) if sources is not None else None
+        with self._lock:
+            self._next += 1
+            self._subscribers[self._next] = (callback, registers, sources)
+            return self._next
+
+    def unsubscribe(self, token):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def publish(self, events):
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for callback, registers, sources in subscribers:
+            if registers is None and sources is None:
+                selected = events
+            else:
+                selected = [e for e in events
+                            if (registers is None or e.register in registers)
+                            and (sources is None or e.source in sources)]
+            if selected:
+                try:
+                    callback(selected)
+                except Exception as e:
+                    print(f"[ERROR] Event subscriber {callback!r} failed: {e}")
+
+
+class ChangeStream:
+    # ChangeFilter + EventBus: feed every poll, subscribers only see changes
+    def __init__(self, register_map=None, max_silence: float = DEFAULT_MAX_SILENCE, deadbands=None):
+        self.filter = ChangeFilter(register_map, max_silence, deadbands)
+        self.bus = EventBus()
+        self.samples = 0
+        self.published = 0
+
+    def feed(self, source, values, timestamp=None):
+        events = self.filter.changes(source, values, timestamp)
+        self.samples += len(values)
+        self.published += len(events)
+        self.bus.publish(events)
+        return events
+
+    def subscribe(self, callback, registers=None, sources=None):
+        return self.bus.subscribe(callback, registers, sources)
+
+    def unsubscribe(self, token):
+        self.bus.unsubscribe(token)
@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+
+FIELDS = ("timestamp", "charger", "register", "socket", "value")
+DEFAULT_BATCH = 500
+
+
+class RowWriter(ABC):
+    extension = ""
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH, rotate_bytes: int = 0, rotate_seconds: float = 0):
+        self.path = path
+        self.batch_size = batch_size
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._rows = []
+        self._file = None
+        self._opened_at = 0.0
+        self._written = 0
+
+    def _target(self):
+        if self.path == "-":
+            return None
+        if not (self.rotate_bytes or self.rotate_seconds):
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        root = f"{root}-{time.strftime('%Y%m%d-%H%M%S')}"
+        ext = ext or self.extension
+        # Several rotations in one second get -1, -2, ... instead of overwriting each other
+        path, sequence = f"{root}{ext}", 0
+        while os.path.exists(path):
+            sequence += 1
+            path = f"{root}-{sequence}{ext}"
+        return path
+
+    def _should_rotate(self):
+        if self._file is None or self.path == "-":
+            return self._file is None
+        if self.rotate_bytes and self._written >= self.rotate_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        self._close_file()
+        self._open_file(self._target())
+        self._opened_at = time.time()
+        self._written = 0
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if not self._rows:
+            return
+        if self._should_rotate():
+            self._rotate()
+        rows, self._rows = self._rows, []
+        self._written += self._write_rows(rows)
+
+    def close(self):
+        self.flush()
+        self._close_file()
+
+    @abstractmethod
+    def _open_file(self, path):
+        pass
+
+    @abstractmethod
+    def _write_rows(self, rows):
+        pass
+
+    def _close_file(self):
+        if self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+        self._file = None
+
+
+class CsvWriter(RowWriter):
+    extension = ".csv"
+
+    def _open_file(self, path):
+        self._file = sys.stdout if path is None else open(path, "w", newline="", encoding="utf-8")
+        csv.writer(self._file).writerow(FIELDS)
+
+    def _write_rows(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([row[field] for field in FIELDS] for row in rows)
+        text = buffer.getvalue()
+        self._file.write(text)
+        self._file.flush()
+        return len(text)
+
+
+class JsonLinesWriter(RowWriter):
+    extension = ".jsonl"
+
+    def _open_file(self, path):
+        self._file = sys.stdout if path is None else open(path, "w", encoding="utf-8")
+
+    def _write_rows(self, rows):
+        text = "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+        self._file.write(text)
+        self._file.flush()
+        return len(text)
+
+
+class ParquetWriter(RowWriter):
+    extension = ".parquet"
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires the 'pyarrow' package")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._schema = pyarrow.schema([
+            ("timestamp", pyarrow.float64()),
+            ("charger", pyarrow.string()),
+            ("register", pyarrow.string()),
+            ("socket", pyarrow.int8()),
+            ("value", pyarrow.string()),
+        ])
+        super().__init__(*args, **kwargs)
+
+    def _open_file(self, path):
+        if path is None:
+            raise RuntimeError("Parquet output cannot be written to stdout")
+        self._file = self._pq.ParquetWriter(path, self._schema)
+
+    def _write_rows(self, rows):
+        # One row group per batch
+        columns = {field: [row[field] for row in rows] for field in FIELDS}
+        table = self._pa.Table.from_pydict(columns, schema=self._schema)
+        self._file.write_table(table)
+        return table.nbytes
+
+
+WRITERS = {
+    "csv": CsvWriter,
+    "jsonl": JsonLinesWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def poll_rows(result):
+    # Long format: one row per register and socket of a PollResult
+    charger = result.charger.key
+    for (register, socket), value in result.values.items():
+        yield {
+            "timestamp": result.timestamp,
+            "charger": charger,
+            "register": register,
+            "socket": socket,
+            "value": value,
+        }
+
+
+def event_rows(events):
+    # Same columns from a list of events.ChangeEvent
+    for event in events:
+        yield {
+            "timestamp": event.timestamp,
+            "charger": event.source,
+            "register": event.register,
+            "socket": event.socket,
+            "value": event.value,
+        }
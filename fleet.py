@@ -0,0 +1,357 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+
+from pymodbus.client.asynchronous.async_io import AsyncioModbusTcpClient
+
+import heartbeat
+from decoder import decoder_for
+from io_worker import PRIORITY_ALIVE, PRIORITY_READ, PRIORITY_WRITE
+from metrics import registry
+from pipeline import DEFAULT_WINDOW
+from read_planner import DEFAULT_MAX_GAP
+from reconnect import (CONNECTED, DISCONNECTED, FAILURES_BEFORE_RECONNECT, RECONNECTING, ExceptionResponse,
+                       is_link_error, reconnect_delay)
+from registers import DEFAULT_MODEL, RegisterType, convert_from, load_map
+
+
+class PriorityLock:
+    # asyncio lock that is handed to the waiter with the lowest priority value on
+    # release, so an alive write doesn't queue up behind the next poll
+    def __init__(self):
+        self._locked = False
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    def locked(self):
+        return self._locked
+
+    def waiting(self, priority: int):
+        # True if someone served before priority is waiting
+        return any(p < priority and not future.done() for p, _, future in self._waiters)
+
+    async def acquire(self, priority: int = PRIORITY_READ):
+        if not self._locked and not self._waiters:
+            self._locked = True
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # handed over just as the wait was cancelled
+            raise
+
+    def release(self):
+        # Ownership passes straight to the next waiter; cancelled ones are skipped
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._locked = False
+
+    def hold(self, priority: int = PRIORITY_READ):
+        return _Held(self, priority)
+
+
+class _Held:
+    def __init__(self, lock, priority):
+        self.lock = lock
+        self.priority = priority
+
+    async def __aenter__(self):
+        await self.lock.acquire(self.priority)
+
+    async def __aexit__(self, *exc):
+        self.lock.release()
+
+
+class Charger:
+    def __init__(self, host: str, port: int = 502, model: str = DEFAULT_MODEL, unit: int = None,
+                 window: int = DEFAULT_WINDOW):
+        self.host = host
+        self.port = port
+        self.register_map = load_map(model)
+        self.unit = self.register_map.unit if unit is None else unit
+        self.window = window  # reads kept in flight on the connection, matched by transaction id
+        self.client = None
+        self.lock = None  # serializes polls and writes on the connection, created on the loop
+        self.state = DISCONNECTED
+        self.failures = 0  # consecutive failed polls
+        self.attempt = 0  # failed connects since the link was last up
+        self.retry_at = 0.0  # time.monotonic() of the next connect attempt
+        self.metrics = registry.connection(self.key)
+
+    @property
+    def key(self):
+        return f"{self.host}:{self.port}"
+
+    def is_connected(self):
+        return self.client is not None and self.client.connected
+
+
+class PollResult:
+    def __init__(self, charger: Charger, timestamp: float):
+        self.charger = charger
+        self.timestamp = timestamp
+        self.values = {}  # (name, socket) -> text
+        self.blocks = []  # (reg_type, addr, words) as read
+        self.error = None
+
+    def __repr__(self):
+        return f"PollResult({self.charger.key}, values={len(self.values)}, error={self.error!r})"
+
+
+class FleetPoller:
+    def __init__(self, chargers, names=None, interval: float = 1.0, concurrency: int = 100,
+                 timeout: float = 3.0, max_gap: int = DEFAULT_MAX_GAP, connect_concurrency: int = 20):
+        self.chargers = list(chargers)
+        self.names = list(names) if names is not None else None
+        self.interval = interval
+        self.timeout = timeout
+        self.max_gap = max_gap
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Few handshakes at a time, so a site-wide outage doesn't end in a connect storm
+        self._connecting = asyncio.Semaphore(connect_concurrency)
+        self._heartbeats = None
+        self._listeners = []
+
+    def add_state_listener(self, callback):
+        # callback(charger, state, detail), called on the event loop
+        self._listeners.append(callback)
+
+    def _set_state(self, charger: Charger, state, detail=""):
+        if charger.state == state and not detail:
+            return
+        charger.state = state
+        for callback in list(self._listeners):
+            try:
+                callback(charger, state, detail)
+            except Exception as e:
+                print(f"[ERROR] Connection state listener failed: {e}")
+
+    def plan(self, charger: Charger):
+        # Every charger of the same model shares one prebuilt read plan
+        return charger.register_map.plan(self.names, self.max_gap)
+
+    async def connect(self, charger: Charger):
+        if charger.client is None:
+            charger.client = AsyncioModbusTcpClient(charger.host, port=charger.port,
+                                                    loop=asyncio.get_event_loop())
+        await asyncio.wait_for(charger.client.connect(), self.timeout)
+        return charger.is_connected()
+
+    async def read_block(self, charger: Charger, block):
+        protocol = charger.client.protocol
+        if block.reg_type == RegisterType.INPUT:
+            fc, request = 4, protocol.read_input_registers(block.addr, block.nb, unit=charger.unit)
+        else:
+            fc, request = 3, protocol.read_holding_registers(block.addr, block.nb, unit=charger.unit)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(request, self.timeout)
+        except asyncio.TimeoutError:
+            charger.metrics.observe(fc, block.addr, block.nb, time.perf_counter() - started)
+            raise
+        except Exception as e:
+            charger.metrics.observe(fc, block.addr, block.nb, time.perf_counter() - started, error=e)
+            raise
+        charger.metrics.observe(fc, block.addr, block.nb, time.perf_counter() - started, result=result)
+        if getattr(result, "exception_code", None) is not None:
+            raise ExceptionResponse(result.exception_code, f"Device rejected reading {block.nb} registers "
+                                                           f"from addr {block.addr}: exception {result.exception_code}")
+        if not hasattr(result, "registers") or len(result.registers) < block.nb:
+            raise IOError(f"Failed to read {block.nb} registers from addr {block.addr}")
+        return result.registers
+
+    async def read_blocks(self, charger: Charger, blocks):
+        if charger.window <= 1:
+            results = []
+            for block in blocks:
+                await self._yield(charger)
+                results.append(await self.read_block(charger, block))
+            return results
+        # The client matches responses by transaction id, so several reads can be
+        # outstanding; one round-trip instead of one per block on slow links
+        window = asyncio.Semaphore(charger.window)
+
+        async def read(block):
+            async with window:
+                return await self.read_block(charger, block)
+
+        results = await asyncio.gather(*(read(block) for block in blocks), return_exceptions=True)
+        for data in results:
+            if isinstance(data, Exception):
+                raise data
+        return results
+
+    def _lock(self, charger: Charger):
+        if charger.lock is None:
+            charger.lock = PriorityLock()
+        return charger.lock
+
+    async def _yield(self, charger: Charger):
+        # Between the blocks of a poll a waiting write or alive gets the connection, so it
+        # waits for one read at most instead of the whole poll
+        lock = charger.lock
+        if lock is not None and lock.locked() and lock.waiting(PRIORITY_READ):
+            lock.release()
+            await lock.acquire(PRIORITY_READ)
+            if not charger.is_connected():
+                raise ConnectionError(f"{charger.key} disconnected during the poll")
+
+    async def _ensure_connected(self, charger: Charger):
+        if charger.is_connected():
+            return
+        wait = charger.retry_at - time.monotonic()
+        if wait > 0:
+            raise ConnectionError(f"{charger.key} is down, next attempt in {wait:.1f} s")
+        async with self._connecting:
+            try:
+                connected = await self.connect(charger)
+                error = None
+            except Exception as e:
+                connected, error = False, e
+        if connected:
+            detail = f"reconnected after {charger.attempt} attempt(s)" if charger.attempt else ""
+            charger.attempt = charger.failures = 0
+            self._set_state(charger, CONNECTED, detail)
+            return
+        self.disconnect(charger)
+        charger.attempt += 1
+        charger.retry_at = time.monotonic() + reconnect_delay(charger.attempt)
+        self._set_state(charger, RECONNECTING, f"attempt {charger.attempt} failed")
+        raise ConnectionError(f"Unable to connect to {charger.key}: {error or 'refused'}")
+
+    def disconnect(self, charger: Charger):
+        if charger.client is not None:
+            charger.client.stop()
+            charger.client = None
+
+    def _request_failed(self, charger: Charger, error):
+        # A dead link is dropped and retried after a jittered delay instead of on every poll
+        if not charger.is_connected():
+            return
+        charger.failures += 1
+        if is_link_error(error) or charger.failures >= FAILURES_BEFORE_RECONNECT:
+            self.disconnect(charger)
+            charger.retry_at = time.monotonic() + reconnect_delay(0)
+            self._set_state(charger, RECONNECTING, str(error) or type(error).__name__)
+
+    async def poll(self, charger: Charger):
+        result = PollResult(charger, time.time())
+        async with self._semaphore, self._lock(charger).hold(PRIORITY_READ):
+            try:
+                await self._ensure_connected(charger)
+                blocks = self.plan(charger)
+                for block, data in zip(blocks, await self.read_blocks(charger, blocks)):
+                    result.blocks.append((block.reg_type, block.addr, data))
+                    result.values.update(decoder_for(block, charger.register_map).decode_text(data))
+                charger.failures = 0
+            except Exception as e:
+                result.error = e
+                self._request_failed(charger, e)
+        failsafe = result.values.get(("Failsafe Timeout", 1))
+        if self._heartbeats is not None and failsafe is not None:
+            self._heartbeats.set_interval(charger.key, heartbeat.alive_interval(int(failsafe)))
+        return result
+
+    async def write(self, charger: Charger, addr: int, value, priority: int = PRIORITY_WRITE):
+        # An int goes out as FC6, a list of words as one FC16 request. Goes through the
+        # same connection as the poll, between two of its reads at most
+        async with self._lock(charger).hold(priority):
+            await self._ensure_connected(charger)
+            protocol = charger.client.protocol
+            if isinstance(value, (list, tuple)):
+                fc, count = 16, len(value)
+                request = protocol.write_registers(addr, list(value), unit=charger.unit)
+            else:
+                fc, count = 6, 1
+                request = protocol.write_register(addr, value, unit=charger.unit)
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(request, self.timeout)
+            except asyncio.TimeoutError as e:
+                charger.metrics.observe(fc, addr, count, time.perf_counter() - started)
+                self._request_failed(charger, e)
+                raise
+            except Exception as e:
+                charger.metrics.observe(fc, addr, count, time.perf_counter() - started, error=e)
+                self._request_failed(charger, e)
+                raise
+            charger.metrics.observe(fc, addr, count, time.perf_counter() - started, result=result)
+            if result.isError():
+                raise IOError(f"Write to addr {addr} failed: {result}")
+            return result
+
+    async def write_register(self, charger: Charger, name: str, value, socket: int = 1,
+                             priority: int = PRIORITY_WRITE):
+        d = charger.register_map[name]
+        addr = d.socket2_addr if socket == 2 else d.addr
+        if addr is None:
+            raise ValueError(f"{charger.key} has no socket {socket} for {name}")
+        words = convert_from(d.data_type, d.nb, value, charger.register_map.word_order)
+        return await self.write(charger, addr, words[0] if len(words) == 1 else words, priority)
+
+    async def write_all(self, setpoints, name: str = "Charging Current", socket: int = 1):
+        # setpoints: {charger: value}, or one value for every charger. All chargers are
+        # written concurrently; returns {charger key: None on success or the exception}
+        if not isinstance(setpoints, dict):
+            setpoints = {charger: setpoints for charger in self.chargers}
+
+        async def write_one(charger, value):
+            async with self._semaphore:
+                try:
+                    await self.write_register(charger, name, value, socket)
+                    return charger.key, None
+                except Exception as e:
+                    return charger.key, e
+
+        return dict(await asyncio.gather(*(write_one(charger, value) for charger, value in setpoints.items())))
+
+    async def stream(self):
+        loop = asyncio.get_event_loop()
+        next_cycle = loop.time()
+        while True:
+            tasks = [loop.create_task(self.poll(charger)) for charger in self.chargers]
+            for task in asyncio.as_completed(tasks):
+                yield await task
+            next_cycle += self.interval
+            delay = next_cycle - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Overran the interval, start the next cycle right away
+                next_cycle = loop.time()
+
+    def start_heartbeats(self, scheduler=None):
+        # Alive writes for every charger from the one shared heartbeat thread; the rate
+        # follows Failsafe Timeout whenever the poll includes it
+        self._heartbeats = scheduler if scheduler is not None else heartbeat.scheduler
+        loop = asyncio.get_event_loop()
+        for charger in self.chargers:
+            self._heartbeats.register(charger.key, functools.partial(self._send_alive, charger, loop))
+
+    def _send_alive(self, charger: Charger, loop):
+        # Runs on the heartbeat thread, the write itself runs on the loop
+        if charger.is_connected():
+            asyncio.run_coroutine_threadsafe(self._alive(charger), loop)
+
+    async def _alive(self, charger: Charger):
+        try:
+            # Ahead of polls waiting for the connection, like PRIORITY_ALIVE on the IoWorker
+            await self.write_register(charger, "Alive Register", 1, priority=PRIORITY_ALIVE)
+        except Exception as e:
+            print(f"[ERROR] Alive write to {charger.key} failed: {e}")
+
+    def close(self):
+        if self._heartbeats is not None:
+            for charger in self.chargers:
+                self._heartbeats.unregister(charger.key)
+        for charger in self.chargers:
+            self.disconnect(charger)
+            charger.state = DISCONNECTED
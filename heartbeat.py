@@ -0,0 +1,112 @@
+import heapq
+import itertools
+import threading
+import time
+
+from metrics import Histogram
+
+# Alive writes go out at this fraction of the charger's Failsafe Timeout
+ALIVE_FRACTION = 1 / 3
+MIN_INTERVAL = 0.5
+DEFAULT_INTERVAL = 1.0
+LATENESS_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+def alive_interval(failsafe_timeout):
+    # Failsafe Timeout is in seconds; 0 or unknown keeps the old once-a-second rate
+    if not failsafe_timeout:
+        return DEFAULT_INTERVAL
+    return max(MIN_INTERVAL, failsafe_timeout * ALIVE_FRACTION)
+
+
+class Heartbeat:
+    __slots__ = ("key", "send", "interval", "due", "active")
+
+    def __init__(self, key, send, interval, due):
+        self.key = key
+        self.send = send
+        self.interval = interval
+        self.due = due
+        self.active = True
+
+
+class HeartbeatScheduler:
+    # One thread and a heap of due times for every open connection. send() must not
+    # block (submit to an IoWorker or an event loop); returning False unregisters it.
+    def __init__(self, name: str = "heartbeat"):
+        self.name = name
+        self.lateness = Histogram(LATENESS_BUCKETS)
+        self._heap = []
+        self._seq = itertools.count()
+        self._beats = {}  # key -> Heartbeat
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._beats)
+
+    def register(self, key, send, interval: float = DEFAULT_INTERVAL, immediate: bool = True):
+        with self._wakeup:
+            self._remove(key)
+            due = time.monotonic() + (0 if immediate else interval)
+            beat = self._beats[key] = Heartbeat(key, send, interval, due)
+            heapq.heappush(self._heap, (due, next(self._seq), beat))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        return beat
+
+    def set_interval(self, key, interval: float):
+        with self._wakeup:
+            beat = self._beats.get(key)
+            if beat is not None:
+                beat.interval = interval
+
+    def unregister(self, key):
+        with self._wakeup:
+            self._remove(key)
+
+    def _remove(self, key):
+        # Lazy removal: the heap entry is skipped when it comes up
+        beat = self._beats.pop(key, None)
+        if beat is not None:
+            beat.active = False
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while self._heap and not self._heap[0][2].active:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    if not self._wakeup.wait(5.0) and not self._heap:
+                        self._thread = None
+                        return
+                    continue
+                due, _, beat = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            now = time.monotonic()
+            self.lateness.observe(now - due)
+            try:
+                keep = beat.send() is not False
+            except Exception as e:
+                print(f"[ERROR] Heartbeat for {beat.key} failed: {e}")
+                keep = True
+            with self._wakeup:
+                if not beat.active:
+                    continue
+                if not keep:
+                    self._remove(beat.key)
+                    continue
+                # Next beat on the original grid so the rate doesn't drift; skip missed ones
+                beat.due = due + beat.interval
+                if beat.due <= now:
+                    beat.due = now + beat.interval
+                heapq.heappush(self._heap, (beat.due, next(self._seq), beat))
+
+
+scheduler = HeartbeatScheduler()
@@ -0,0 +1,120 @@
+import threading
+import time
+from array import array
+
+DEFAULT_DEPTH = 28800  # 2 h at 4 Hz, 8 h at 1 Hz
+
+
+class RingBuffer:
+    __slots__ = ("depth", "_times", "_values", "_next", "_size")
+
+    def __init__(self, depth: int = DEFAULT_DEPTH):
+        self.depth = depth
+        self._times = array("d", bytes(8 * depth))
+        self._values = array("d", bytes(8 * depth))
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp: float, value: float):
+        i = self._next
+        self._times[i] = timestamp
+        self._values[i] = value
+        self._next = (i + 1) % self.depth
+        if self._size < self.depth:
+            self._size += 1
+
+    def _physical(self, i):
+        # Logical index 0 is the oldest sample
+        return (self._next - self._size + i) % self.depth
+
+    def _bisect(self, timestamp):
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._physical(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slice(self, data, start, stop):
+        if start >= stop:
+            return data[0:0]
+        first = self._physical(start)
+        last = first + (stop - start)
+        if last <= self.depth:
+            return data[first:last]
+        return data[first:] + data[:last - self.depth]
+
+    def range(self, since=None, until=None):
+        start = 0 if since is None else self._bisect(since)
+        stop = self._size if until is None else self._bisect(until)
+        return self._slice(self._times, start, stop), self._slice(self._values, start, stop)
+
+    def window(self, seconds: float, now=None):
+        now = time.time() if now is None else now
+        return self.range(now - seconds, None)
+
+    def last(self, n: int):
+        start = max(self._size - n, 0)
+        return self._slice(self._times, start, self._size), self._slice(self._values, start, self._size)
+
+    def latest(self):
+        if not self._size:
+            return None
+        i = self._physical(self._size - 1)
+        return self._times[i], self._values[i]
+
+    def stats(self, seconds: float, now=None):
+        _, values = self.window(seconds, now)
+        if not values:
+            return None
+        return min(values), max(values), sum(values) / len(values)
+
+    def clear(self):
+        self._next = 0
+        self._size = 0
+
+
+class HistoryStore:
+    def __init__(self, depth: int = DEFAULT_DEPTH):
+        self.depth = depth
+        self._series = {}  # (charger, register, socket) -> RingBuffer
+        self._lock = threading.Lock()
+
+    def series(self, charger, register, socket=1, create=False):
+        key = (charger, register, socket)
+        buffer = self._series.get(key)
+        if buffer is None and create:
+            with self._lock:
+                buffer = self._series.setdefault(key, RingBuffer(self.depth))
+        return buffer
+
+    def record(self, charger, register, socket, value, timestamp=None):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False  # strings and N/A are not kept
+        timestamp = time.time() if timestamp is None else timestamp
+        self.series(charger, register, socket, create=True).append(timestamp, value)
+        return True
+
+    def record_values(self, charger, values, timestamp=None):
+        # values: (register, socket) -> value, as emitted by the poll loop
+        timestamp = time.time() if timestamp is None else timestamp
+        for (register, socket), value in values.items():
+            self.record(charger, register, socket, value, timestamp)
+
+    def keys(self):
+        return list(self._series)
+
+    def clear(self, charger=None):
+        with self._lock:
+            if charger is None:
+                self._series.clear()
+            else:
+                for key in [k for k in self._series if k[0] == charger]:
+                    del self._series[key]
@@ -0,0 +1,83 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Lower value is served first
+PRIORITY_STOP = -1
+PRIORITY_WRITE = 0
+PRIORITY_ALIVE = 1
+PRIORITY_READ = 2
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class IoRequest:
+    __slots__ = ("func", "args", "deadline", "future")
+
+    def __init__(self, func, args, deadline):
+        self.func = func
+        self.args = args
+        self.deadline = deadline
+        self.future = Future()
+
+
+class IoWorker:
+    def __init__(self, name: str = "modbus-io"):
+        self.name = name
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.is_running():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True):
+        if not self.is_running():
+            return
+        self._queue.put((PRIORITY_STOP, next(self._seq), None))
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def submit(self, func, *args, priority: int = PRIORITY_READ, timeout: float = None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        request = IoRequest(func, args, deadline)
+        if not self.is_running():
+            request.future.set_exception(RuntimeError(f"{self.name} is not running"))
+            return request.future
+        self._queue.put((priority, next(self._seq), request))
+        return request.future
+
+    def _run(self):
+        while True:
+            _, _, request = self._queue.get()
+            if request is None:
+                break
+            self._execute(request)
+        # Fail whatever is still queued so no caller waits forever
+        while True:
+            try:
+                _, _, request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None and request.future.set_running_or_notify_cancel():
+                request.future.set_exception(RuntimeError(f"{self.name} stopped"))
+
+    def _execute(self, request: IoRequest):
+        if not request.future.set_running_or_notify_cancel():
+            return
+        if request.deadline is not None and time.monotonic() > request.deadline:
+            request.future.set_exception(DeadlineExceeded("Request expired before it was sent"))
+            return
+        try:
+            request.future.set_result(request.func(*request.args))
+        except Exception as e:
+            request.future.set_exception(e)
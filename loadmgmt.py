@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import time
+from typing import NamedTuple, Tuple
+
+SETPOINT_REGISTER = "Charging Current"
+LOAD_REGISTERS = [
+    "Charging State", "Number of Phases",
+    "Current L1", "Current L2", "Current L3",
+    "Active Power L1", "Active Power L2", "Active Power L3",
+    "EVSE Min Current", "EVSE Max Current", "Cable Max Current",
+    SETPOINT_REGISTER, "Failsafe Timeout",
+]
+CURRENT_SCALE = 0.001  # Current L1-L3 are in mA, the setpoint and EVSE limits in A
+CHARGING = 1  # Charging State value while the car draws current
+DEMAND_HEADROOM = 2  # A above the measured draw a car that takes less than offered keeps
+DEFAULT_MAX_CURRENT = 32  # A assumed for a socket whose limits haven't been read yet
+
+
+class Demand(NamedTuple):
+    key: Tuple[str, int]  # (charger key, socket)
+    phases: Tuple[int, ...]  # indexes of the grid phases used, 0 = L1
+    lo: int  # EVSE Min Current; below it the charger has to pause
+    hi: int  # smallest of EVSE Max, Cable Max and the measured demand
+
+
+def _phase_load(demands, amps, phase_count=3):
+    load = [0] * phase_count
+    for d, a in zip(demands, amps):
+        for p in d.phases:
+            load[p] += a
+    return load
+
+
+def _fits(demands, amps, limits):
+    load = _phase_load(demands, amps, len(limits))
+    return all(l <= limit for l, limit in zip(load, limits))
+
+
+def _level(demands, amps, free, level):
+    # Chargers in `free` at clamp(level, lo, hi), the others kept where they are
+    return [min(max(level, d.lo), d.hi) if i in free else amps[i] for i, d in enumerate(demands)]
+
+
+def allocate(demands, limits):
+    # Max-min fair ("water filling") split of per-phase limits in whole amps.
+    # Chargers whose minimum doesn't fit are paused (0 A), last ones first.
+    demands = sorted(demands, key=lambda d: d.key)
+    active = list(demands)
+    paused = []
+    while active:
+        load = _phase_load(active, [d.lo for d in active], len(limits))
+        over = {p for p, l in enumerate(load) if l > limits[p]}
+        if not over:
+            break
+        # Only chargers on an overloaded phase make room, the last one first
+        i = max(i for i, d in enumerate(active) if over.intersection(d.phases))
+        paused.append(active.pop(i))
+
+    # A later pause can free enough for an earlier one, take those back before filling
+    for d in reversed(paused):
+        if _fits(active + [d], [x.lo for x in active] + [d.lo], limits):
+            active.append(d)
+    active.sort(key=lambda d: d.key)
+    if not active:
+        return {d.key: 0 for d in demands}
+
+    # Raise a common level until some phase is full, freeze the chargers on it
+    # (or at their maximum) and keep raising the rest
+    amps = [d.lo for d in active]
+    free = set(range(len(active)))
+    level = 0
+    while free:
+        lo, hi = level, max(active[i].hi for i in free)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if _fits(active, _level(active, amps, free, mid), limits):
+                lo = mid
+            else:
+                hi = mid - 1
+        level = lo
+        amps = _level(active, amps, free, level)
+        load = _phase_load(active, amps, len(limits))
+        rising = [0] * len(limits)
+        for i in free:
+            if amps[i] == level < active[i].hi:
+                for p in active[i].phases:
+                    rising[p] += 1
+        full = {p for p in range(len(limits)) if load[p] + rising[p] > limits[p]}
+        frozen = {i for i in free if amps[i] >= active[i].hi or full.intersection(active[i].phases)}
+        if not frozen:
+            break
+        free -= frozen
+
+    # Whole amps left over by the level go one at a time to the lowest allocations,
+    # round after round until no charger can take another amp
+    raised = True
+    while raised:
+        raised = False
+        for i in sorted(range(len(active)), key=lambda i: amps[i]):
+            d = active[i]
+            if amps[i] < d.hi and all(load[p] + 1 <= limits[p] for p in d.phases):
+                amps[i] += 1
+                for p in d.phases:
+                    load[p] += 1
+                raised = True
+
+    allocation = {d.key: 0 for d in demands}
+    allocation.update((d.key, a) for d, a in zip(active, amps))
+    return allocation
+
+
+def _int(values, name, socket, default=0):
+    try:
+        return int(values.get((name, socket), default))
+    except (TypeError, ValueError):
+        return default
+
+
+class LoadManager:
+    # Closed loop: poll the fleet, split the site limit over the charging sockets,
+    # write only the setpoints that changed
+    def __init__(self, poller, limits, interval: float = 1.0, follow_demand: bool = True, dry_run: bool = False):
+        self.poller = poller
+        self.limits = tuple(limits)  # A per grid phase, L1..L3
+        self.interval = interval
+        self.follow_demand = follow_demand
+        self.dry_run = dry_run
+        self.setpoints = {}  # (charger key, socket) -> last written A
+        self.rated = {}  # (charger key, socket) -> EVSE Max Current last read
+        self.chargers = {charger.key: charger for charger in poller.chargers}
+
+    def demands(self, results):
+        # Returns the controllable demands and the per-phase current nobody can control:
+        # sockets without a setpoint register and chargers that didn't answer
+        demands = []
+        fixed = [0.0] * len(self.limits)
+        for result in results:
+            charger = result.charger
+            register_map = charger.register_map
+            sockets = (1, 2) if any(d.socket2_addr for d in register_map.defs) else (1,)
+            setpoint = register_map[SETPOINT_REGISTER]
+            for socket in sockets:
+                key = (charger.key, socket)
+                controllable = (setpoint.addr if socket == 1 else setpoint.socket2_addr) is not None
+                if result.error is not None:
+                    # Unknown state: keep room for what it was last allowed, or for
+                    # everything it could draw if it was never written
+                    reserve = self.setpoints.get(key, self.rated.get(key, DEFAULT_MAX_CURRENT))
+                    for p in range(len(self.limits)):
+                        fixed[p] += reserve
+                    continue
+                values = result.values
+                self.rated[key] = _int(values, "EVSE Max Current", socket, DEFAULT_MAX_CURRENT)
+                currents = [_int(values, f"Current L{p + 1}", socket) * CURRENT_SCALE for p in range(3)]
+                if not controllable:
+                    for p in range(len(self.limits)):
+                        fixed[p] += currents[p]
+                    continue
+                if _int(values, "Charging State", socket) != CHARGING:
+                    continue
+                used = tuple(p for p, amps in enumerate(currents) if amps > 0)
+                if not used:
+                    used = tuple(range(max(1, min(_int(values, "Number of Phases", 1, 3), 3))))
+                lo = _int(values, "EVSE Min Current", socket, 6)
+                hi = self.rated[key]
+                cable = _int(values, "Cable Max Current", socket)
+                if cable:
+                    hi = min(hi, cable)
+                offered = self.setpoints.get(key)
+                if self.follow_demand and offered is not None and max(currents) + DEMAND_HEADROOM < offered:
+                    # The car takes less than offered, give the rest to the others
+                    hi = min(hi, max(int(max(currents)) + DEMAND_HEADROOM, lo))
+                demands.append(Demand(key, used, lo, max(hi, lo)))
+        return demands, fixed
+
+    async def cycle(self):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.poller.poll(charger) for charger in self.poller.chargers))
+        demands, fixed = self.demands(results)
+        limits = [max(0, int(limit - used)) for limit, used in zip(self.limits, fixed)]
+        allocation = allocate(demands, limits)
+
+        # Idle sockets go back to their minimum so a newly plugged car starts low
+        for result in results:
+            if result.error is None:
+                for socket in (1, 2):
+                    key = (result.charger.key, socket)
+                    if key not in allocation and (SETPOINT_REGISTER, socket) in result.values:
+                        allocation[key] = _int(result.values, "EVSE Min Current", socket, 6)
+        changed = {}
+        for (charger_key, socket), amps in allocation.items():
+            if self.setpoints.get((charger_key, socket)) != amps:
+                changed.setdefault(socket, {})[self.chargers[charger_key]] = amps
+
+        errors = {}
+        for socket, setpoints in changed.items():
+            if self.dry_run:
+                acks = {charger.key: None for charger in setpoints}
+            else:
+                acks = await self.poller.write_all(setpoints, SETPOINT_REGISTER, socket)
+            for charger, amps in setpoints.items():
+                if acks[charger.key] is None:
+                    self.setpoints[(charger.key, socket)] = amps
+                else:
+                    errors[charger.key] = acks[charger.key]
+
+        power = sum(_int(r.values, f"Active Power L{p}", s) for r in results for p in (1, 2, 3) for s in (1, 2))
+        return {
+            "cycle_ms": (time.perf_counter() - started) * 1000,
+            "charging": len(demands),
+            "written": sum(len(setpoints) for setpoints in changed.values()),
+            "errors": errors,
+            "site_power_w": power,
+            "phase_load_a": _phase_load(demands, [allocation[d.key] for d in demands], len(self.limits)),
+        }
+
+    async def run(self, cycles=None):
+        loop = asyncio.get_event_loop()
+        next_cycle = loop.time()
+        count = 0
+        while cycles is None or count < cycles:
+            report = await self.cycle()
+            count += 1
+            yield report
+            next_cycle += self.interval
+            delay = next_cycle - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_cycle = loop.time()
+
+
+async def run_manager(manager, cycles=None):
+    async for report in manager.run(cycles):
+        print(f"{report['cycle_ms']:7.1f} ms  charging {report['charging']:4d}  "
+              f"written {report['written']:4d}  load {report['phase_load_a']} A  "
+              f"power {report['site_power_w'] / 1000:.1f} kW")
+        for key, error in report["errors"].items():
+            print(f"[ERROR] {key}: {error}")
+
+
+def main():
+    from controller import parse_charger
+    from fleet import Charger, FleetPoller
+    from metrics import MetricsServer
+    from registers import available_models
+
+    parser = argparse.ArgumentParser(description="Share a site current limit between chargers")
+    parser.add_argument("chargers", nargs="+", help="host or host:port of each charger")
+    parser.add_argument("--model", default="EVC04", choices=available_models())
+    parser.add_argument("--limit", type=float, nargs="+", required=True,
+                        help="site limit in A per phase; one value for all three phases or L1 L2 L3")
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--cycles", type=int)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--no-follow-demand", action="store_true",
+                        help="don't lower the share of cars that draw less than offered")
+    parser.add_argument("--dry-run", action="store_true", help="compute setpoints without writing them")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:<port>/metrics")
+    args = parser.parse_args()
+    if len(args.limit) not in (1, 3):
+        parser.error("--limit takes one or three values")
+
+    limits = args.limit * 3 if len(args.limit) == 1 else args.limit
+    chargers = [Charger(*parse_charger(text, args.model)) for text in args.chargers]
+    poller = FleetPoller(chargers, LOAD_REGISTERS, args.interval, args.concurrency, args.timeout)
+    manager = LoadManager(poller, limits, args.interval, not args.no_follow_demand, args.dry_run)
+    if not args.dry_run:
+        poller.start_heartbeats()
+    if args.metrics_port:
+        MetricsServer(args.metrics_port).start()
+    try:
+        asyncio.get_event_loop().run_until_complete(run_manager(manager, args.cycles))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        poller.close()
+
+
+if __name__ == "__main__":
+    main()
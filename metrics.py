@@ -0,0 +1,187 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Round-trip buckets in seconds
+RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MBAP_HEADER = 7
+FC_NAMES = {3: "read_holding", 4: "read_input", 6: "write_single", 16: "write_multiple"}
+FAMILIES = (  # (name, type, help) in exposition order
+    ("modbus_requests_total", "counter", "Modbus requests sent"),
+    ("modbus_timeouts_total", "counter", "Requests that got no response"),
+    ("modbus_exceptions_total", "counter", "Modbus exception responses"),
+    ("modbus_errors_total", "counter", "Requests that failed with an error, e.g. a lost connection"),
+    ("modbus_bytes_sent_total", "counter", "Modbus TCP bytes sent"),
+    ("modbus_bytes_received_total", "counter", "Modbus TCP bytes received"),
+    ("modbus_rtt_seconds", "histogram", "Request round-trip time"),
+)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=RTT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th sample
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+def request_bytes(fc, count):
+    if fc == 16:
+        return MBAP_HEADER + 6 + 2 * count
+    return MBAP_HEADER + 5
+
+
+def response_bytes(fc, count):
+    if fc in (3, 4):
+        return MBAP_HEADER + 2 + 2 * count
+    return MBAP_HEADER + 5
+
+
+class ConnectionMetrics:
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.requests = {}  # fc -> count
+        self.rtt = {}  # fc -> Histogram
+        self.timeouts = 0
+        self.exceptions = 0  # Modbus exception responses
+        self.errors = 0  # raised errors, e.g. lost connection
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.last_request = None  # (fc, addr, count)
+
+    def observe(self, fc, addr, count, rtt, result=None, error=None):
+        self.requests[fc] = self.requests.get(fc, 0) + 1
+        histogram = self.rtt.get(fc)
+        if histogram is None:
+            histogram = self.rtt[fc] = Histogram()
+        histogram.observe(rtt)
+        self.last_request = (fc, addr, count)
+        self.bytes_sent += request_bytes(fc, count)
+        if error is not None:
+            self.errors += 1
+        elif result is None or type(result).__name__ == "ModbusIOException":
+            self.timeouts += 1
+        elif result.isError():
+            self.exceptions += 1
+            self.bytes_received += MBAP_HEADER + 2
+        else:
+            self.bytes_received += response_bytes(fc, count)
+
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    def rtt_quantile(self, q):
+        merged = Histogram()
+        for histogram in list(self.rtt.values()):
+            merged.count += histogram.count
+            for i, n in enumerate(histogram.counts):
+                merged.counts[i] += n
+        return merged.quantile(q)
+
+    def summary(self):
+        return (f"Req: {self.total_requests()}  "
+                f"RTT p50/p95: {self.rtt_quantile(0.5) * 1000:.0f}/{self.rtt_quantile(0.95) * 1000:.0f} ms  "
+                f"Timeouts: {self.timeouts}  Errors: {self.exceptions + self.errors}")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self, label: str = ""):
+        metrics = ConnectionMetrics(label)
+        with self._lock:
+            self._connections.append(metrics)
+        return metrics
+
+    def remove(self, metrics):
+        with self._lock:
+            if metrics in self._connections:
+                self._connections.remove(metrics)
+
+    def render_prometheus(self):
+        # Text exposition format: each family once, its HELP/TYPE then the samples of
+        # every connection; families must not be split
+        with self._lock:
+            connections = list(self._connections)
+        families = {name: [] for name, _, _ in FAMILIES}
+        for m in connections:
+            conn = f'connection="{m.label}"'
+            for fc, n in list(m.requests.items()):
+                families["modbus_requests_total"].append(
+                    f'modbus_requests_total{{{conn},function="{FC_NAMES.get(fc, fc)}"}} {n}')
+            families["modbus_timeouts_total"].append(f"modbus_timeouts_total{{{conn}}} {m.timeouts}")
+            families["modbus_exceptions_total"].append(f"modbus_exceptions_total{{{conn}}} {m.exceptions}")
+            families["modbus_errors_total"].append(f"modbus_errors_total{{{conn}}} {m.errors}")
+            families["modbus_bytes_sent_total"].append(f"modbus_bytes_sent_total{{{conn}}} {m.bytes_sent}")
+            families["modbus_bytes_received_total"].append(
+                f"modbus_bytes_received_total{{{conn}}} {m.bytes_received}")
+            rtt = families["modbus_rtt_seconds"]
+            for fc, histogram in list(m.rtt.items()):
+                labels = f'{conn},function="{FC_NAMES.get(fc, fc)}"'
+                cumulative = 0
+                for bound, n in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                    cumulative += n
+                    rtt.append(f'modbus_rtt_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                rtt.append(f"modbus_rtt_seconds_sum{{{labels}}} {histogram.sum}")
+                rtt.append(f"modbus_rtt_seconds_count{{{labels}}} {histogram.count}")
+        lines = []
+        for name, kind, help_text in FAMILIES:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(families[name])
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsServer:
+    def __init__(self, port: int, host: str = "127.0.0.1", metrics_registry: MetricsRegistry = registry):
+        metrics = metrics_registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
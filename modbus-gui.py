@@ -1,426 +1,76 @@
 #!/usr/bin/env python3
+import argparse
 import sys
-import threading
 import time
-from abc import ABC
-from enum import Enum
 
 from PyQt5 import QtCore, QtWidgets
-from PyQt5.QtCore import QObject, qDebug
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
 
+from capture import ReplayController
 from controller import Controller
+from dashboard import RegisterTableModel
+from history import HistoryStore
+from metrics import MetricsServer
+from trend import MODE_LTTB, MODE_MINMAX, TrendWidget
+from registers import load_map, registers
+from server import RemoteController
+from worker import ModbusWorker
 
-
-class DataType(Enum):
-    UINT16 = "uint16"
-    UINT32 = "uint32"
-    STRING = "string"
-
-
-class RegisterType(Enum):
-    INPUT = "R"
-    HOLDING = "R/W"
-
-
-class Register(ABC):
-    def __init__(self):
-        self.addr = 0
-        self.nb = 0
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.STRING
-
-
-class SerialNumberRegister(Register):
-    def __init__(self):
-        self.addr = 100
-        self.nb = 25
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.STRING
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class ChargepointIDRegister(Register):
-    def __init__(self):
-        self.addr = 130
-        self.nb = 50
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.STRING
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class BrandRegister(Register):
-    def __init__(self):
-        self.addr = 190
-        self.nb = 10
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.STRING
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class ModelRegister(Register):
-    def __init__(self):
-        self.addr = 210
-        self.nb = 5
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.STRING
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class FirmwareVersionRegister(Register):
-    def __init__(self):
-        self.addr = 230
-        self.nb = 50
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.STRING
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class DateRegister(Register):
-    def __init__(self):
-        self.addr = 290
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class TimeRegister(Register):
-    def __init__(self):
-        self.addr = 294
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class ChargepointPowerRegister(Register):
-    def __init__(self):
-        self.addr = 400
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3400  # EVC10 için 2. soket karşılığı
-
-
-class NumberOfPhasesRegister(Register):
-    def __init__(self):
-        self.addr = 404
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-class PhaseSwitch(Register):
-    def __init__(self):
-        self.addr = 405
-        self.nb = 1
-        self.reg_type = RegisterType.HOLDING
-        self.data_type = DataType.UINT16
-        self.socket2_addr = None  # EVC10 için 2. soket karşılığı yok
-
-
-class ChargepointStateRegister(Register):
-    def __init__(self):
-        self.addr = 1000
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3000  # EVC10 için 2. soket karşılığı
-
-
-
-class ChargingStateRegister(Register):
-    def __init__(self):
-        self.addr = 1001
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3001  # EVC10 için 2. soket karşılığı
-
-class EquipmentStateRegister(Register):
-    def __init__(self):
-        self.addr = 1002
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3002  # EVC10 için 2. soket karşılığı
-
-class CableStateRegister(Register):
-    def __init__(self):
-        self.addr = 1004
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3004  # EVC10 için 2. soket karşılığı
-
-class EvseFaultCodeRegister(Register):
-    def __init__(self):
-        self.addr = 1006
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3006  # EVC10 için 2. soket karşılığı
-
-class CurrentL1Register(Register):
-    def __init__(self):
-        self.addr = 1008
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3008  # EVC10 için 2. soket karşılığı
-
-class CurrentL2Register(Register):
-    def __init__(self):
-        self.addr = 1010
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3010  # EVC10 için 2. soket karşılığı
-
-class CurrentL3Register(Register):
-    def __init__(self):
-        self.addr = 1012
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3012  # EVC10 için 2. soket karşılığı
-
-class VoltageL1Register(Register):
-    def __init__(self):
-        self.addr = 1014
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3014  # EVC10 için 2. soket karşılığı
-
-class VoltageL2Register(Register):
-    def __init__(self):
-        self.addr = 1016
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3016  # EVC10 için 2. soket karşılığı
-
-class VoltageL3Register(Register):
-    def __init__(self):
-        self.addr = 1018
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3018  # EVC10 için 2. soket karşılığı
-
-class ActivePowerTotalRegister(Register):
-    def __init__(self):
-        self.addr = 1020
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3020  # EVC10 için 2. soket karşılığı
-
-class ActivePowerL1Register(Register):
-    def __init__(self):
-        self.addr = 1024
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3024  # EVC10 için 2. soket karşılığı
-
-class ActivePowerL2Register(Register):
-    def __init__(self):
-        self.addr = 1028
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3028  # EVC10 için 2. soket karşılığı
-
-class ActivePowerL3Register(Register):
-    def __init__(self):
-        self.addr = 1032
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3032  # EVC10 için 2. soket karşılığı
-
-class MeterReadingRegister(Register):
-    def __init__(self):
-        self.addr = 1036
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3036  # EVC10 için 2. soket karşılığı
-
-class SessionMaxCurrentRegister(Register):
-    def __init__(self):
-        self.addr = 1100
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3100  # EVC10 için 2. soket karşılığı
-
-class EvseMinCurrentRegister(Register):
-    def __init__(self):
-        self.addr = 1102
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3102  # EVC10 için 2. soket karşılığı
-
-class EvseMaxCurrentRegister(Register):
-    def __init__(self):
-        self.addr = 1104
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3104  # EVC10 için 2. soket karşılığı
-
-class CableMaxCurrentRegister(Register):
-    def __init__(self):
-        self.addr = 1106
-        self.nb = 1
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT16
-        self.socket2_addr = 3106  # EVC10 için 2. soket karşılığı
-
-class SessionEnergyRegister(Register):
-    def __init__(self):
-        self.addr = 1502
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3502  # EVC10 için 2. soket karşılığı
-
-class SessionStartTimeRegister(Register):
-    def __init__(self):
-        self.addr = 1504
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3504  # EVC10 için 2. soket karşılığı
-
-class SessionDurationRegister(Register):
-    def __init__(self):
-        self.addr = 1508
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3508  # EVC10 için 2. soket karşılığı
-
-class SessionEndTimeRegister(Register):
-    def __init__(self):
-        self.addr = 1512
-        self.nb = 2
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.UINT32
-        self.socket2_addr = 3512  # EVC10 için 2. soket karşılığı
-
-class SessionRFIDTagRegister(Register):
-    def __init__(self):
-        self.addr = 1516
-        self.nb = 15
-        self.reg_type = RegisterType.INPUT
-        self.data_type = DataType.STRING
-        self.socket2_addr = 3516  # EVC10 için 2. soket karşılığı
-
-
-class FailsafeCurrentRegister(Register):
-    def __init__(self):
-        self.addr = 2000
-        self.nb = 1
-        self.reg_type = RegisterType.HOLDING
-        self.data_type = DataType.UINT16
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class FailsafeTimeoutRegister(Register):
-    def __init__(self):
-        self.addr = 2002
-        self.nb = 1
-        self.reg_type = RegisterType.HOLDING
-        self.data_type = DataType.UINT16
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class ChargingCurrentRegister(Register):
-    def __init__(self):
-        self.addr = 5004
-        self.nb = 1
-        self.reg_type = RegisterType.HOLDING
-        self.data_type = DataType.UINT16
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-class AliveRegister(Register):
-    def __init__(self):
-        self.addr = 6000
-        self.nb = 1
-        self.reg_type = RegisterType.HOLDING
-        self.data_type = DataType.UINT16
-        self.socket2_addr = None  # EVC10 için karşılığı yok
-
-
-registers = {
-    "Serial Number": SerialNumberRegister,
-    "Chargepoint ID": ChargepointIDRegister,
-    "Brand": BrandRegister,
-    "Model": ModelRegister,
-    "Firmware Version": FirmwareVersionRegister,
-    "Date": DateRegister,
-    "Time": TimeRegister,
-    "Chargepoint Power": ChargepointPowerRegister,
-    "Number of Phases": NumberOfPhasesRegister,
-    "Phase Switch": PhaseSwitch,
-    "Chargepoint State": ChargepointStateRegister,
-    "Charging State": ChargingStateRegister,
-    "Equipment State": EquipmentStateRegister,
-    "Cable State": CableStateRegister,
-    "EVSE Fault Code": EvseFaultCodeRegister,
-    "Current L1": CurrentL1Register,
-    "Current L2": CurrentL2Register,
-    "Current L3": CurrentL3Register,
-    "Voltage L1": VoltageL1Register,
-    "Voltage L2": VoltageL2Register,
-    "Voltage L3": VoltageL3Register,
-    "Active Power Total": ActivePowerTotalRegister,
-    "Active Power L1": ActivePowerL1Register,
-    "Active Power L2": ActivePowerL2Register,
-    "Active Power L3": ActivePowerL3Register,
-    "Meter Reading": MeterReadingRegister,
-    "Session Max Current": SessionMaxCurrentRegister,
-    "EVSE Min Current": EvseMinCurrentRegister,
-    "EVSE Max Current": EvseMaxCurrentRegister,
-    "Cable Max Current": CableMaxCurrentRegister,
-    "Session Energy": SessionEnergyRegister,
-    "Session Start Time": SessionStartTimeRegister,
-    "Session End Time": SessionEndTimeRegister,
-    "Session RFID Tag": SessionRFIDTagRegister,
-    "Failsafe Current": FailsafeCurrentRegister,
-    "Failsafe Timeout": FailsafeTimeoutRegister,
-    "Charging Current": ChargingCurrentRegister,
-    "Alive Register": AliveRegister
-}
-
-
-def convert_to(data_type, read_data):
-    if data_type == DataType.UINT16:
-        text = " ".join(str(x) for x in read_data)
-    elif data_type == DataType.UINT32:
-        result = 0
-        multiplier = 0
-        read_data.reverse()
-        for chunk in read_data:
-            result += int(chunk) * (2 ** multiplier)
-            multiplier += 16
-        text = str(result)
-    elif data_type == DataType.STRING:
-        text = "".join(chr(x) for x in read_data)
-    return text
+TREND_REGISTERS = [
+    "Current L1", "Current L2", "Current L3",
+    "Voltage L1", "Voltage L2", "Voltage L3",
+    "Active Power Total",
+]
 
 
 class Ui_MainWindow(QObject):
-    def __init__(self):
+    request_connect = pyqtSignal(str, int, int)
+    request_disconnect = pyqtSignal()
+    request_start_reading = pyqtSignal(str)
+    request_stop_reading = pyqtSignal()
+    request_write = pyqtSignal(str, int)
+    request_watch = pyqtSignal(str, list)
+    request_unwatch = pyqtSignal(str)
+    request_refresh = pyqtSignal()
+
+    def __init__(self, controller=None):
         super().__init__()
-        self.c = Controller()
+        self.c = controller if controller is not None else Controller()
         self.is_reading = False
+        self.is_dashboard_running = False
+        self.is_trend_running = False
+        self.is_connected = False
+        self.dashboard_model = RegisterTableModel(registers)
+        self.history = HistoryStore()
+        self.charger_key = ""
+
+        # Modbus I/O runs in its own thread, never on the GUI thread
+        self.worker_thread = QThread()
+        self.worker = ModbusWorker(self.c)
+        self.worker.moveToThread(self.worker_thread)
+        queued = QtCore.Qt.QueuedConnection
+        self.request_connect.connect(self.worker.connect_device, queued)
+        self.request_disconnect.connect(self.worker.disconnect_device, queued)
+        self.request_start_reading.connect(self.worker.start_reading, queued)
+        self.request_stop_reading.connect(self.worker.stop_reading, queued)
+        self.request_write.connect(self.worker.write_value, queued)
+        self.request_watch.connect(self.worker.watch, queued)
+        self.request_unwatch.connect(self.worker.unwatch, queued)
+        self.request_refresh.connect(self.worker.refresh, queued)
+        self.worker.connection_changed.connect(self.connection_changed, queued)
+        self.worker.value_read.connect(self.value_read, queued)
+        self.worker.reading_stopped.connect(self.reading_stopped, queued)
+        self.worker.values_read.connect(self.dashboard_model.update_values, queued)
+        self.worker.values_read.connect(self.record_values, queued)
+        self.worker.watch_stopped.connect(self.watch_stopped, queued)
+        self.worker.connection_state.connect(self.connection_state, queued)
+        self.worker_thread.start()
+
+    def shutdown(self):
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        if hasattr(self.c, "stop_recording"):
+            self.c.stop_recording()
 
     def is_device_evc10(self):
         return self.radioButton_evc10.isChecked()
@@ -428,7 +78,7 @@ class Ui_MainWindow(QObject):
     def setupUi(self, MainWindow):
         # Main Window
         MainWindow.setObjectName("MainWindow")
-        MainWindow.resize(340, 255)
+        MainWindow.resize(340, 280)
 
         # Tab Widget
         self.centralwidget = QtWidgets.QWidget(MainWindow)
@@ -494,6 +144,8 @@ class Ui_MainWindow(QObject):
         self.device_layout.addWidget(self.radioButton_evc04)
 
         self.radioButton_evc10 = QtWidgets.QRadioButton(self.widget_device)
+        self.radioButton_evc10.toggled.connect(self.worker.set_evc10, QtCore.Qt.QueuedConnection)
+        self.radioButton_evc10.toggled.connect(self.device_changed)
         self.device_layout.addWidget(self.radioButton_evc10)
 
         self.verticalLayout_2.addWidget(self.widget_device)
@@ -532,44 +184,9 @@ class Ui_MainWindow(QObject):
         sizePolicy.setHeightForWidth(self.comboBox.sizePolicy().hasHeightForWidth())
         self.comboBox.setSizePolicy(sizePolicy)
         self.comboBox.setObjectName("comboBox")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
-        self.comboBox.addItem("")
+        for _ in registers:
+            self.comboBox.addItem("")
+        self.comboBox.currentTextChanged.connect(self.worker.set_register, QtCore.Qt.QueuedConnection)
         self.verticalLayout_3.addWidget(self.comboBox)
         self.widget_6 = QtWidgets.QWidget(self.tab_read)
         self.widget_6.setObjectName("widget_6")
@@ -584,6 +201,11 @@ class Ui_MainWindow(QObject):
         self.lineEdit_19.setReadOnly(True)
         self.lineEdit_19.setObjectName("lineEdit_19")
         self.horizontalLayout_5.addWidget(self.lineEdit_19)
+        # Drops cached values and reads everything on screen now
+        self.pushButton_refresh = QtWidgets.QPushButton(self.widget_6)
+        self.pushButton_refresh.setObjectName("pushButton_refresh")
+        self.pushButton_refresh.clicked.connect(self.request_refresh.emit)
+        self.horizontalLayout_5.addWidget(self.pushButton_refresh)
         self.verticalLayout_3.addWidget(self.widget_6)
         self.pushButton_6 = QtWidgets.QPushButton(self.tab_read)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Maximum)
@@ -597,6 +219,70 @@ class Ui_MainWindow(QObject):
         self.verticalLayout_3.addWidget(self.pushButton_6)
         self.tabWidget.addTab(self.tab_read, "")
 
+        # Dashboard Tab
+        self.tab_dashboard = QtWidgets.QWidget()
+        self.tab_dashboard.setEnabled(False)
+        self.tab_dashboard.setObjectName("tab_dashboard")
+        self.verticalLayout_dashboard = QtWidgets.QVBoxLayout(self.tab_dashboard)
+        self.verticalLayout_dashboard.setObjectName("verticalLayout_dashboard")
+        self.tableView_dashboard = QtWidgets.QTableView(self.tab_dashboard)
+        self.tableView_dashboard.setObjectName("tableView_dashboard")
+        self.tableView_dashboard.setModel(self.dashboard_model)
+        self.tableView_dashboard.verticalHeader().setVisible(False)
+        self.tableView_dashboard.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
+        self.tableView_dashboard.horizontalHeader().setStretchLastSection(True)
+        self.verticalLayout_dashboard.addWidget(self.tableView_dashboard)
+        self.pushButton_dashboard = QtWidgets.QPushButton(self.tab_dashboard)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Maximum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.pushButton_dashboard.sizePolicy().hasHeightForWidth())
+        self.pushButton_dashboard.setSizePolicy(sizePolicy)
+        self.pushButton_dashboard.setObjectName("pushButton_dashboard")
+        self.pushButton_dashboard.clicked.connect(self.dashboard_clicked)
+        self.pushButton_dashboard.setStyleSheet("background-color: green")
+        self.verticalLayout_dashboard.addWidget(self.pushButton_dashboard)
+        self.tabWidget.addTab(self.tab_dashboard, "")
+
+        # Trend Tab
+        self.tab_trend = QtWidgets.QWidget()
+        self.tab_trend.setEnabled(False)
+        self.tab_trend.setObjectName("tab_trend")
+        self.verticalLayout_trend = QtWidgets.QVBoxLayout(self.tab_trend)
+        self.verticalLayout_trend.setObjectName("verticalLayout_trend")
+        self.listWidget_trend = QtWidgets.QListWidget(self.tab_trend)
+        self.listWidget_trend.setObjectName("listWidget_trend")
+        self.listWidget_trend.setFlow(QtWidgets.QListView.LeftToRight)
+        self.listWidget_trend.setWrapping(True)
+        self.listWidget_trend.setMaximumHeight(48)
+        for name in TREND_REGISTERS:
+            item = QtWidgets.QListWidgetItem(name, self.listWidget_trend)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Checked if name.startswith("Current") else QtCore.Qt.Unchecked)
+        self.listWidget_trend.itemChanged.connect(self.trend_series_changed)
+        self.verticalLayout_trend.addWidget(self.listWidget_trend)
+        self.trend_widget = TrendWidget(self.tab_trend)
+        self.trend_widget.setObjectName("trend_widget")
+        self.verticalLayout_trend.addWidget(self.trend_widget)
+        self.widget_trend = QtWidgets.QWidget(self.tab_trend)
+        self.widget_trend.setObjectName("widget_trend")
+        self.horizontalLayout_trend = QtWidgets.QHBoxLayout(self.widget_trend)
+        self.horizontalLayout_trend.setObjectName("horizontalLayout_trend")
+        self.horizontalLayout_trend.setContentsMargins(0, 0, 0, 0)
+        self.comboBox_trend = QtWidgets.QComboBox(self.widget_trend)
+        self.comboBox_trend.setObjectName("comboBox_trend")
+        self.comboBox_trend.addItem("", MODE_MINMAX)
+        self.comboBox_trend.addItem("", MODE_LTTB)
+        self.comboBox_trend.currentIndexChanged.connect(self.trend_mode_changed)
+        self.horizontalLayout_trend.addWidget(self.comboBox_trend)
+        self.pushButton_trend = QtWidgets.QPushButton(self.widget_trend)
+        self.pushButton_trend.setObjectName("pushButton_trend")
+        self.pushButton_trend.clicked.connect(self.trend_clicked)
+        self.pushButton_trend.setStyleSheet("background-color: green")
+        self.horizontalLayout_trend.addWidget(self.pushButton_trend)
+        self.verticalLayout_trend.addWidget(self.widget_trend)
+        self.tabWidget.addTab(self.tab_trend, "")
+
         # Write Tab
         self.tab_write = QtWidgets.QWidget()
         self.tab_write.setEnabled(False)
@@ -643,6 +329,16 @@ class Ui_MainWindow(QObject):
 
         self.verticalLayout.addWidget(self.tabWidget)
         MainWindow.setCentralWidget(self.centralwidget)
+
+        # Status bar with per-connection request statistics
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        self.label_metrics = QtWidgets.QLabel(self.statusbar)
+        self.statusbar.addWidget(self.label_metrics)
+        MainWindow.setStatusBar(self.statusbar)
+        self.metrics_timer = QtCore.QTimer(MainWindow)
+        self.metrics_timer.timeout.connect(self.update_metrics)
+        self.metrics_timer.start(1000)
         MainWindow.setFixedSize(MainWindow.size())
 
         self.retranslateUi(MainWindow)
@@ -667,50 +363,26 @@ class Ui_MainWindow(QObject):
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_connect), _translate("MainWindow", "Connect"))
 
         # Read Tab
-        self.comboBox.setItemText(0, _translate("MainWindow", "Serial Number"))
-        self.comboBox.setItemText(1, _translate("MainWindow", "Chargepoint ID"))
-        self.comboBox.setItemText(2, _translate("MainWindow", "Brand"))
-        self.comboBox.setItemText(3, _translate("MainWindow", "Model"))
-        self.comboBox.setItemText(4, _translate("MainWindow", "Firmware Version"))
-        self.comboBox.setItemText(5, _translate("MainWindow", "Date"))
-        self.comboBox.setItemText(6, _translate("MainWindow", "Time"))
-        self.comboBox.setItemText(7, _translate("MainWindow", "Chargepoint Power"))
-        self.comboBox.setItemText(8, _translate("MainWindow", "Number of Phases"))
-        self.comboBox.setItemText(9, _translate("MainWindow", "Phase Switch"))
-        self.comboBox.setItemText(10, _translate("MainWindow", "Chargepoint State"))
-        self.comboBox.setItemText(11, _translate("MainWindow", "Charging State"))
-        self.comboBox.setItemText(12, _translate("MainWindow", "Equipment State"))
-        self.comboBox.setItemText(13, _translate("MainWindow", "Cable State"))
-        self.comboBox.setItemText(14, _translate("MainWindow", "EVSE Fault Code"))
-        self.comboBox.setItemText(15, _translate("MainWindow", "Current L1"))
-        self.comboBox.setItemText(16, _translate("MainWindow", "Current L2"))
-        self.comboBox.setItemText(17, _translate("MainWindow", "Current L3"))
-        self.comboBox.setItemText(18, _translate("MainWindow", "Voltage L1"))
-        self.comboBox.setItemText(19, _translate("MainWindow", "Voltage L2"))
-        self.comboBox.setItemText(20, _translate("MainWindow", "Voltage L3"))
-        self.comboBox.setItemText(21, _translate("MainWindow", "Active Power Total"))
-        self.comboBox.setItemText(22, _translate("MainWindow", "Active Power L1"))
-        self.comboBox.setItemText(23, _translate("MainWindow", "Active Power L2"))
-        self.comboBox.setItemText(24, _translate("MainWindow", "Active Power L3"))
-        self.comboBox.setItemText(25, _translate("MainWindow", "Meter Reading"))
-        self.comboBox.setItemText(26, _translate("MainWindow", "Session Max Current"))
-        self.comboBox.setItemText(27, _translate("MainWindow", "EVSE Min Current"))
-        self.comboBox.setItemText(28, _translate("MainWindow", "EVSE Max Current"))
-        self.comboBox.setItemText(29, _translate("MainWindow", "Cable Max Current"))
-        self.comboBox.setItemText(30, _translate("MainWindow", "Session Energy"))
-        self.comboBox.setItemText(31, _translate("MainWindow", "Session Start Time"))
-        self.comboBox.setItemText(32, _translate("MainWindow", "Session End Time"))
-        self.comboBox.setItemText(33, _translate("MainWindow", "Session RFID Tag"))
-        self.comboBox.setItemText(34, _translate("MainWindow", "Failsafe Current"))
-        self.comboBox.setItemText(35, _translate("MainWindow", "Failsafe Timeout"))
-        self.comboBox.setItemText(36, _translate("MainWindow", "Charging Current"))
-        self.comboBox.setItemText(37, _translate("MainWindow", "Alive Register"))
+        for i, name in enumerate(registers):
+            self.comboBox.setItemText(i, _translate("MainWindow", name))
 
         self.lineEdit_19.setPlaceholderText(_translate("MainWindow", "Data"))
+        self.pushButton_refresh.setText(_translate("MainWindow", "Refresh"))
+        self.pushButton_refresh.setShortcut(_translate("MainWindow", "F5"))
         self.pushButton_6.setText(_translate("MainWindow", "Start"))
         self.pushButton_6.setShortcut(_translate("MainWindow", "Return"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_read), _translate("MainWindow", "Read"))
 
+        # Dashboard Tab
+        self.pushButton_dashboard.setText(_translate("MainWindow", "Start"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_dashboard), _translate("MainWindow", "Dashboard"))
+
+        # Trend Tab
+        self.comboBox_trend.setItemText(0, _translate("MainWindow", "Min/Max"))
+        self.comboBox_trend.setItemText(1, _translate("MainWindow", "LTTB"))
+        self.pushButton_trend.setText(_translate("MainWindow", "Start"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_trend), _translate("MainWindow", "Trend"))
+
         # Write Tab
         self.comboBox_3.setItemText(0, _translate("MainWindow", "Failsafe Current"))
         self.comboBox_3.setItemText(1, _translate("MainWindow", "Failsafe Timeout"))
@@ -722,117 +394,166 @@ class Ui_MainWindow(QObject):
         self.pushButton_8.setShortcut(_translate("MainWindow", "Return"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_write), _translate("MainWindow", "Write"))
 
-    def get_register(self, text):
-        return registers.get(text)()
-
     def connect_clicked(self):
-        if self.c.is_connected():
-            self.c.disconnect()
+        self.pushButton_2.setEnabled(False)
+        if self.is_connected:
+            self.request_disconnect.emit()
+        else:
+            self.charger_key = f"{self.host_edit.text()}:{self.port_edit.text()}"
+            self.request_connect.emit(self.host_edit.text(), int(self.port_edit.text()), int(self.timeout_edit.text()))
+
+    def connection_changed(self, connected):
+        self.is_connected = connected
+        self.pushButton_2.setEnabled(True)
+        if not connected:
             self.pushButton_2.setText("Connect")
             self.pushButton_2.setStyleSheet("background-color: green")
             self.host_edit.setEnabled(True)
             self.port_edit.setEnabled(True)
             self.timeout_edit.setEnabled(True)
             self.tab_read.setEnabled(False)
+            self.tab_dashboard.setEnabled(False)
+            self.tab_trend.setEnabled(False)
             self.tab_write.setEnabled(False)
             self.lineEdit_19.clear()
-            self.is_reading = False
-            self.pushButton_6.setText("Start")
-            self.pushButton_6.setStyleSheet("background-color: green")
+            self.reading_stopped()
+            self.dashboard_stopped()
+            self.trend_stopped()
         else:
-            if self.c.connect(self.host_edit.text(), int(self.port_edit.text()), int(self.timeout_edit.text())):
-                self.pushButton_2.setText("Disconnect")
-                self.pushButton_2.setStyleSheet("background-color: red")
-                self.host_edit.setEnabled(False)
-                self.port_edit.setEnabled(False)
-                self.timeout_edit.setEnabled(False)
-                self.tab_read.setEnabled(True)
-                self.tab_write.setEnabled(True)
+            self.pushButton_2.setText("Disconnect")
+            self.pushButton_2.setStyleSheet("background-color: red")
+            self.host_edit.setEnabled(False)
+            self.port_edit.setEnabled(False)
+            self.timeout_edit.setEnabled(False)
+            self.tab_read.setEnabled(True)
+            self.tab_dashboard.setEnabled(True)
+            self.tab_trend.setEnabled(True)
+            self.tab_write.setEnabled(True)
 
     def read_clicked(self):
         if self.is_reading:
-            self.is_reading = False
-            self.pushButton_6.setText("Start")
-            self.pushButton_6.setStyleSheet("background-color: green")
+            self.request_stop_reading.emit()
         else:
             self.is_reading = True
             self.pushButton_6.setText("Stop")
             self.pushButton_6.setStyleSheet("background-color: red")
-            read_thread = threading.Thread(target=self.read_func, daemon=True)
-            read_thread.start()
-
-    def write_clicked(self):
-        if self.c.is_connected():
-            self.write_register(self.get_register(self.comboBox_3.currentText()), int(self.lineEdit_21.text()))
-
-    def read_func(self):
-        try:
-            while self.is_reading and self.c.is_connected():
-                reg = self.get_register(self.comboBox.currentText())
-                text = self.read_register(reg)
-                self.lineEdit_19.setText(text)
-                time.sleep(0.25)
-        except Exception as e:
-            qDebug(str(e))
-
-    def read_register(self, reg: Register):
-        text = ""
-        if reg.reg_type == RegisterType.INPUT:
-            read_data = self.c.read_input(reg.addr, reg.nb)
-        else:
-            read_data = self.c.read_holding(reg.addr, reg.nb)
-
-        if read_data:
-            text = convert_to(reg.data_type, list(read_data))
-        else:
-            return "N/A"
-
-        # EVC10 için Socket 2'yi dene
-        if self.is_device_evc10() and hasattr(reg, "socket2_addr") and reg.socket2_addr:
-            second_addr = reg.socket2_addr
-            try:
-                if reg.reg_type == RegisterType.INPUT:
-                    read_data2 = self.c.read_input(second_addr, reg.nb)
-                else:
-                    read_data2 = self.c.read_holding(second_addr, reg.nb)
-
-                if (
-                    isinstance(read_data2, list)
-                    and len(read_data2) > 0
-                    and (
-                        reg.data_type != DataType.STRING or any(x != 0 for x in read_data2)
-                    )
-                ):
-                    text2 = convert_to(reg.data_type, read_data2)
-                    if isinstance(text2, str) and text2.strip():
-                        text = f"Socket 1: {text} | Socket 2: {text2}"
-
-            except Exception:
-                pass
-
-        return text
-
-
-
-
-
-
+            self.request_start_reading.emit(self.comboBox.currentText())
 
+    def reading_stopped(self):
+        self.is_reading = False
+        self.pushButton_6.setText("Start")
+        self.pushButton_6.setStyleSheet("background-color: green")
 
+    def value_read(self, name, text):
+        if self.is_reading and name == self.comboBox.currentText():
+            self.lineEdit_19.setText(text)
 
-    def write_register(self, reg: Register, data):
-        if reg.data_type == DataType.UINT16:
-            self.c.write(reg.addr, data)
+    def dashboard_clicked(self):
+        if self.is_dashboard_running:
+            self.request_unwatch.emit("dashboard")
         else:
-            #TODO
-            pass
+            self.is_dashboard_running = True
+            self.pushButton_dashboard.setText("Stop")
+            self.pushButton_dashboard.setStyleSheet("background-color: red")
+            self.request_watch.emit("dashboard", list(registers))
+
+    def watch_stopped(self, tag):
+        if tag == "dashboard":
+            self.dashboard_stopped()
+        elif tag == "trend":
+            self.trend_stopped()
+
+    def dashboard_stopped(self):
+        self.is_dashboard_running = False
+        self.pushButton_dashboard.setText("Start")
+        self.pushButton_dashboard.setStyleSheet("background-color: green")
+
+    def trend_series_name(self, name, socket):
+        return name if socket == 1 else f"{name} (Socket 2)"
+
+    def trend_clicked(self):
+        if self.is_trend_running:
+            self.request_unwatch.emit("trend")
+            return
+        self.is_trend_running = True
+        self.pushButton_trend.setText("Stop")
+        self.pushButton_trend.setStyleSheet("background-color: red")
+
+        # Start from what is already in the history, then follow new samples
+        self.trend_widget.clear()
+        for charger, name, socket in self.history.keys():
+            if charger == self.charger_key and name in TREND_REGISTERS:
+                times, values = self.history.series(charger, name, socket).range()
+                self.trend_widget.load(self.trend_series_name(name, socket), times, values)
+        for i in range(self.listWidget_trend.count()):
+            self.trend_series_changed(self.listWidget_trend.item(i))
+        self.request_watch.emit("trend", TREND_REGISTERS)
+
+    def trend_stopped(self):
+        self.is_trend_running = False
+        self.pushButton_trend.setText("Start")
+        self.pushButton_trend.setStyleSheet("background-color: green")
+
+    def trend_series_changed(self, item):
+        checked = item.checkState() == QtCore.Qt.Checked
+        for socket in (1, 2):
+            self.trend_widget.set_visible(self.trend_series_name(item.text(), socket), checked)
+
+    def trend_mode_changed(self, index):
+        self.trend_widget.mode = self.comboBox_trend.itemData(index)
+        self.trend_widget.update()
+
+    def device_changed(self, evc10):
+        self.dashboard_model.set_register_map(load_map("EVC10" if evc10 else "EVC04"))
+
+    def record_values(self, values):
+        now = time.time()
+        self.history.record_values(self.charger_key, values, now)
+        if self.is_trend_running:
+            for (name, socket), text in values.items():
+                if name in TREND_REGISTERS and text.isdigit():
+                    self.trend_widget.append(self.trend_series_name(name, socket), now, float(text))
+
+    def update_metrics(self):
+        self.label_metrics.setText(self.c.metrics.summary())
+
+    def connection_state(self, state, detail):
+        text = f"{state.capitalize()}: {detail}" if detail else state.capitalize()
+        self.statusbar.showMessage(text, 5000)
+
+    def write_clicked(self):
+        if self.is_connected:
+            self.request_write.emit(self.comboBox_3.currentText(), int(self.lineEdit_21.text()))
 
 
 def main():
-    app = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:<port>/metrics")
+    parser.add_argument("--record", help="write all Modbus traffic to this capture file")
+    parser.add_argument("--replay", help="show a capture file instead of a live device")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is real time")
+    parser.add_argument("--window", type=int, default=1,
+                        help="Modbus TCP requests kept in flight on the connection, if the device allows it")
+    parser.add_argument("--server", help="use a running server.py (e.g. http://127.0.0.1:8502) instead of "
+                                         "connecting to the device directly")
+    args, qt_args = parser.parse_known_args()
+    if args.metrics_port:
+        MetricsServer(args.metrics_port).start()
+    if args.replay:
+        controller = ReplayController(args.replay, args.speed)
+    elif args.server:
+        controller = RemoteController(args.server)
+    else:
+        controller = Controller()
+        controller.window = args.window
+        if args.record:
+            controller.record(args.record)
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
     MainWindow = QtWidgets.QMainWindow()
-    ui = Ui_MainWindow()
+    ui = Ui_MainWindow(controller)
     ui.setupUi(MainWindow)
+    app.aboutToQuit.connect(ui.shutdown)
     MainWindow.show()
     sys.exit(app.exec_())
 
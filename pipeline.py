@@ -0,0 +1,97 @@
+import itertools
+import struct
+from struct import Struct
+
+from registers import DEFAULT_UNIT
+
+# MBAP header: transaction id, protocol id (0), length of unit id + PDU, unit id
+MBAP = Struct(">HHHB")
+READ_PDU = Struct(">BHH")
+DEFAULT_WINDOW = 1  # plain request/response; raise it for devices that queue requests
+
+
+class PipelineResponse:
+    # Just enough of a pymodbus response for the controller, metrics and capture
+    __slots__ = ("function_code", "registers", "exception_code")
+
+    def __init__(self, function_code, registers=(), exception_code=None):
+        self.function_code = function_code
+        self.registers = registers
+        self.exception_code = exception_code
+
+    def isError(self):
+        return self.exception_code is not None
+
+    def __repr__(self):
+        if self.isError():
+            return f"PipelineResponse(fc={self.function_code}, exception={self.exception_code})"
+        return f"PipelineResponse(fc={self.function_code}, registers={len(self.registers)})"
+
+
+def decode_response(request, pdu):
+    # Checks the PDU answers the (fc, addr, count) request before decoding it
+    fc, _, count = request
+    if len(pdu) < 2 or pdu[0] & 0x7F != fc:
+        raise ConnectionError(f"Response {pdu[:1].hex()} doesn't answer function code {fc}")
+    if pdu[0] & 0x80:
+        return PipelineResponse(fc, exception_code=pdu[1])
+    if pdu[1] != 2 * count or len(pdu) != 2 + 2 * count:
+        raise ConnectionError(f"Response carries {pdu[1]} bytes for {count} registers")
+    return PipelineResponse(fc, list(struct.unpack_from(f">{count}H", pdu, 2)))
+
+
+def _recv_exactly(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by the device")
+        data += chunk
+    return bytes(data)
+
+
+def pipeline(sock, requests, window: int = DEFAULT_WINDOW, timeout: float = 3.0, unit: int = DEFAULT_UNIT,
+             next_tid=None, sent=None, received=None):
+    # Sends read requests [(fc, addr, count)] keeping up to `window` of them outstanding
+    # on one Modbus TCP connection; responses are matched by transaction id, so the
+    # device may answer out of order. Returns one PipelineResponse per request.
+    # next_tid() must be the transaction counter of whatever else talks on the socket
+    # (the client's TransactionManager.getNextTID), so late answers to its requests
+    # can't be taken for ours. sent(i) / received(i, response) are called as request i
+    # goes out / comes back. On any error the socket is closed: what is still on the
+    # way can't be told apart from the next answers.
+    if next_tid is None:
+        counter = itertools.count(1)
+
+        def next_tid():
+            return next(counter) & 0xFFFF
+    results = [None] * len(requests)
+    in_flight = {}  # tid -> request index
+    next_index = 0
+    try:
+        sock.settimeout(timeout)
+        while next_index < len(requests) or in_flight:
+            frames = []
+            while next_index < len(requests) and len(in_flight) < window:
+                tid = next_tid()
+                in_flight[tid] = next_index
+                frames.append(MBAP.pack(tid, 0, READ_PDU.size + 1, unit) + READ_PDU.pack(*requests[next_index]))
+                if sent is not None:
+                    sent(next_index)
+                next_index += 1
+            if frames:
+                sock.sendall(b"".join(frames))
+            tid, protocol, length, _ = MBAP.unpack(_recv_exactly(sock, MBAP.size))
+            if protocol != 0 or length < 2:
+                raise ConnectionError(f"Malformed MBAP header (protocol {protocol}, length {length})")
+            pdu = _recv_exactly(sock, length - 1)
+            index = in_flight.pop(tid, None)
+            if index is None:
+                continue  # late answer to a request on the same socket that timed out
+            results[index] = decode_response(requests[index], pdu)
+            if received is not None:
+                received(index, results[index])
+    except Exception:
+        sock.close()
+        raise
+    return results
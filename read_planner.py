@@ -0,0 +1,50 @@
+MAX_READ_COUNT = 125  # Modbus limit for a single read PDU
+DEFAULT_MAX_GAP = 4
+
+
+class ReadBlock:
+    def __init__(self, reg_type, addr):
+        self.reg_type = reg_type
+        self.addr = addr
+        self.nb = 0
+        self.entries = []  # (key, addr, nb)
+
+    def end(self):
+        return self.addr + self.nb
+
+    def add(self, key, addr, nb):
+        self.entries.append((key, addr, nb))
+        self.nb = max(self.nb, addr + nb - self.addr)
+
+    def slice(self, data, addr, nb):
+        start = addr - self.addr
+        return data[start:start + nb]
+
+    def split(self, data):
+        return {key: self.slice(data, addr, nb) for key, addr, nb in self.entries}
+
+    def __repr__(self):
+        return f"ReadBlock({self.reg_type}, addr={self.addr}, nb={self.nb}, entries={len(self.entries)})"
+
+
+def plan_reads(entries, max_gap=DEFAULT_MAX_GAP, max_count=MAX_READ_COUNT):
+    # entries: iterable of (key, reg_type, addr, nb)
+    by_type = {}
+    for key, reg_type, addr, nb in entries:
+        by_type.setdefault(reg_type, []).append((addr, nb, key))
+
+    blocks = []
+    for reg_type, items in by_type.items():
+        items.sort(key=lambda item: (item[0], item[1]))
+        block = None
+        for addr, nb, key in items:
+            if block is not None:
+                gap = addr - block.end()
+                fits = max(block.end(), addr + nb) - block.addr <= max_count
+                if gap <= max_gap and fits:
+                    block.add(key, addr, nb)
+                    continue
+            block = ReadBlock(reg_type, addr)
+            block.add(key, addr, nb)
+            blocks.append(block)
+    return blocks
@@ -0,0 +1,31 @@
+import random
+
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+
+RECONNECT_BASE = 0.5
+RECONNECT_CAP = 30.0
+FAILURES_BEFORE_RECONNECT = 3  # consecutive timeouts before the link counts as dead
+
+
+class ExceptionResponse(IOError):
+    # The device answered with a Modbus exception (illegal address, busy, ...)
+    def __init__(self, exception_code, message):
+        super().__init__(message)
+        self.exception_code = exception_code
+
+
+def reconnect_delay(attempt: int, base: float = RECONNECT_BASE, cap: float = RECONNECT_CAP):
+    # "Full jitter": anywhere up to the exponential bound, so clients that lost the
+    # link at the same moment don't all come back at the same moment
+    return random.uniform(0, min(cap, base * 2 ** min(attempt, 32)))
+
+
+def is_link_error(error):
+    # Socket level failures (they carry an errno); timeouts and Modbus exception
+    # responses are not enough on their own to call the link dead
+    if isinstance(error, ConnectionError) or type(error).__name__ == "ConnectionException":
+        return True
+    return isinstance(error, OSError) and error.errno is not None
@@ -0,0 +1,175 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from enum import Enum
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+from read_planner import DEFAULT_MAX_GAP, plan_reads
+
+
+class DataType(Enum):
+    UINT16 = "uint16"
+    UINT32 = "uint32"
+    STRING = "string"
+
+
+class RegisterType(Enum):
+    INPUT = "R"
+    HOLDING = "R/W"
+
+
+POLL_ONCE = None  # static registers, read once per connection
+CACHE_FOREVER = float("inf")  # valid until the connection is closed
+
+
+MAPS_DIR = os.path.join(getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__))), "maps")
+DEFAULT_MODEL = "EVC04"
+DEFAULT_UNIT = 0  # Modbus unit id; what the GUI's client has always sent, maps can override it
+PLAN_CACHE_SIZE = 64
+
+
+class RegisterDef(NamedTuple):
+    name: str
+    addr: int
+    nb: int
+    reg_type: RegisterType
+    data_type: DataType
+    socket2_addr: Optional[int] = None
+    poll_interval: Optional[float] = 1.0
+    cache_ttl: Optional[float] = None
+    deadband: Optional[Tuple[float, float]] = None  # (absolute, percent), None means every change
+
+
+def _parse_keyword(value, keyword, keyword_value):
+    return keyword_value if value == keyword else value
+
+
+def _parse_deadband(value):
+    # 2 -> absolute band, "1%" -> percent of the last published value
+    if value is None:
+        return None
+    if isinstance(value, str) and value.endswith("%"):
+        return 0.0, float(value[:-1])
+    return float(value), 0.0
+
+
+class RegisterMap:
+    # Compiled once per model and shared by every connection; only the plan cache changes after load
+    def __init__(self, model: str, defs, word_order: str = "big", unit: int = DEFAULT_UNIT):
+        self.model = model
+        self.word_order = word_order
+        self.unit = unit
+        self.defs = tuple(defs)
+        self.by_name = {d.name: d for d in self.defs}
+        self.by_addr = {}  # (reg_type, addr) -> (RegisterDef, socket)
+        for d in self.defs:
+            self.by_addr[(d.reg_type, d.addr)] = (d, 1)
+            if d.socket2_addr:
+                self.by_addr[(d.reg_type, d.socket2_addr)] = (d, 2)
+        self._plans = OrderedDict()  # (names, max_gap) -> blocks, bounded LRU
+        self._plans_lock = threading.Lock()  # the GUI worker and the event loop plan concurrently
+        self.plan()
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    def __iter__(self):
+        return iter(self.by_name)
+
+    def __len__(self):
+        return len(self.defs)
+
+    def get(self, name, default=None):
+        return self.by_name.get(name, default)
+
+    def entries(self, names=None):
+        for name in self.by_name if names is None else names:
+            d = self.by_name[name]
+            yield (name, 1), d.reg_type, d.addr, d.nb
+            if d.socket2_addr:
+                yield (name, 2), d.reg_type, d.socket2_addr, d.nb
+
+    def plan(self, names=None, max_gap=DEFAULT_MAX_GAP):
+        names = None if names is None else tuple(names)
+        key = (names, max_gap)
+        with self._plans_lock:
+            blocks = self._plans.get(key)
+            if blocks is not None:
+                self._plans.move_to_end(key)
+                return blocks
+        blocks = tuple(plan_reads(self.entries(names), max_gap))
+        with self._plans_lock:
+            self._plans[key] = blocks
+            # Callers asking for changing subsets (the scheduler's due registers) would
+            # otherwise grow the cache forever; the least recently used plan goes
+            while len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return blocks
+
+
+def compile_map(model: str, data) -> RegisterMap:
+    defs = []
+    for item in data["registers"]:
+        defs.append(RegisterDef(
+            name=item["name"],
+            addr=item["addr"],
+            nb=item["nb"],
+            reg_type=RegisterType(item["type"]),
+            data_type=DataType(item["data_type"]),
+            socket2_addr=item.get("socket2_addr"),
+            poll_interval=_parse_keyword(item.get("poll_interval", 1.0), "once", POLL_ONCE),
+            cache_ttl=_parse_keyword(item.get("cache_ttl"), "forever", CACHE_FOREVER),
+            deadband=_parse_deadband(item.get("deadband")),
+        ))
+    return RegisterMap(model, defs, data.get("word_order", "big"), data.get("unit", DEFAULT_UNIT))
+
+
+def load_map(model: str = DEFAULT_MODEL) -> RegisterMap:
+    return _load_map(model.upper())
+
+
+@lru_cache(maxsize=None)
+def _load_map(model: str) -> RegisterMap:
+    path = os.path.join(MAPS_DIR, f"{model.lower()}.json")
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return compile_map(data.get("model", model), data)
+
+
+def available_models():
+    return sorted(os.path.splitext(f)[0].upper() for f in os.listdir(MAPS_DIR) if f.endswith(".json"))
+
+
+registers = load_map(DEFAULT_MODEL)
+
+
+def convert_to(data_type, read_data, word_order="big"):
+    if data_type == DataType.UINT16:
+        text = " ".join(str(x) for x in read_data)
+    elif data_type == DataType.UINT32:
+        result = 0
+        for chunk in (read_data if word_order == "big" else reversed(read_data)):
+            result = (result << 16) | int(chunk)
+        text = str(result)
+    elif data_type == DataType.STRING:
+        text = "".join(chr(x) for x in read_data)
+    return text
+
+
+def convert_from(data_type, nb, value, word_order="big"):
+    # Inverse of convert_to: the words to write for a value
+    if data_type == DataType.STRING:
+        text = str(value)[:nb]
+        return [ord(c) for c in text] + [0] * (nb - len(text))
+    value = int(value)
+    if data_type == DataType.UINT32:
+        if not 0 <= value <= 0xFFFFFFFF:
+            raise ValueError(f"{value} does not fit in a uint32 register")
+        words = [value >> 16, value & 0xFFFF]
+        return words if word_order == "big" else words[::-1]
+    if not 0 <= value <= 0xFFFF:
+        raise ValueError(f"{value} does not fit in a uint16 register")
+    return [value] + [0] * (nb - 1)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import bisect
+import json
+import sys
+import time
+
+from read_planner import MAX_READ_COUNT, ReadBlock
+from reconnect import ExceptionResponse, is_link_error
+from registers import DEFAULT_MODEL, RegisterType, available_models, load_map
+
+ADDRESS_SPACE = 65536
+SINGLE_PROBE = 8  # failing chunks this small are probed address by address instead of halved
+DEFAULT_WINDOW = 8  # reads in flight per connection; 1 for devices that can't queue requests
+
+
+def merge(spans):
+    # [(start, end)] -> sorted, with overlapping and touching spans joined
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def contains(spans, start, end):
+    # spans must be merged
+    i = bisect.bisect_right(spans, (start, ADDRESS_SPACE + 1)) - 1
+    return i >= 0 and spans[i][0] <= start and end <= spans[i][1]
+
+
+def subtract(spans, holes):
+    # Parts of the merged spans not covered by the merged holes
+    result = []
+    for start, end in spans:
+        for hole_start, hole_end in holes:
+            if hole_end <= start or hole_start >= end:
+                continue
+            if hole_start > start:
+                result.append((start, hole_start))
+            start = max(start, hole_end)
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+class Scanner:
+    # Finds the readable address ranges of a device: every chunk of MAX_READ_COUNT is
+    # read concurrently, and a rejected chunk is halved until the holes are pinned down.
+    # Dense areas cost one request per 125 registers, empty ones about one per address.
+    def __init__(self, poller, chargers, window: int = DEFAULT_WINDOW, retries: int = 1,
+                 single_probe: int = SINGLE_PROBE):
+        self.poller = poller
+        self.chargers = list(chargers)  # connections to the same device
+        self.window = window
+        self.retries = retries  # extra attempts after a read timeout
+        self.single_probe = single_probe
+        self.requests = 0
+        self.timeouts = 0
+        self._slots = None
+
+    async def _read(self, reg_type, addr, nb):
+        # True if the device answered the read, False if it rejected it with an exception
+        # response. Anything else means the scan can't be trusted and is raised.
+        charger = await self._slots.get()
+        block = ReadBlock(reg_type, addr)
+        block.add(None, addr, nb)
+        try:
+            if not charger.is_connected():
+                try:
+                    connected = await self.poller.connect(charger)
+                except asyncio.TimeoutError:
+                    connected = False
+                if not connected:
+                    raise ConnectionError(f"Unable to connect to {charger.key}")
+            attempt = 0
+            while True:
+                self.requests += 1
+                try:
+                    await self.poller.read_block(charger, block)
+                    return True
+                except ExceptionResponse:
+                    return False
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    attempt += 1
+                    if attempt > self.retries:
+                        raise TimeoutError(f"No answer to reading {nb} registers from addr {addr}")
+                except Exception as e:
+                    if is_link_error(e):
+                        self.poller.disconnect(charger)
+                    raise
+        finally:
+            self._slots.put_nowait(charger)
+
+    async def _probe(self, reg_type, addr, nb, found):
+        if await self._read(reg_type, addr, nb):
+            found.append((addr, addr + nb))
+            return
+        if nb == 1:
+            return
+        if nb <= self.single_probe:
+            parts = [(a, 1) for a in range(addr, addr + nb)]
+        else:
+            half = nb // 2
+            parts = [(addr, half), (addr + half, nb - half)]
+        await asyncio.gather(*(self._probe(reg_type, a, n, found) for a, n in parts))
+
+    async def scan(self, reg_types=(RegisterType.INPUT, RegisterType.HOLDING), start: int = 0,
+                   end: int = ADDRESS_SPACE):
+        # Returns {reg_type: [(start, end)]} of the readable addresses, end exclusive
+        self._slots = asyncio.Queue()
+        for _ in range(self.window):
+            for charger in self.chargers:
+                self._slots.put_nowait(charger)
+        found = {reg_type: [] for reg_type in reg_types}
+        probes = [
+            asyncio.ensure_future(self._probe(reg_type, addr, min(MAX_READ_COUNT, end - addr), found[reg_type]))
+            for reg_type in reg_types for addr in range(start, end, MAX_READ_COUNT)
+        ]
+        try:
+            await asyncio.gather(*probes)
+        except BaseException:
+            for probe in probes:
+                probe.cancel()
+            raise
+        return {reg_type: merge(spans) for reg_type, spans in found.items()}
+
+
+def compare(discovered, register_map):
+    # Returns the map entries the device won't read, [(name, socket, reg_type, addr, nb)],
+    # and the readable spans no entry covers, {reg_type: [(start, end)]}
+    missing = []
+    known = {reg_type: [] for reg_type in discovered}
+    for (name, socket), reg_type, addr, nb in register_map.entries():
+        if reg_type not in discovered:
+            continue
+        known[reg_type].append((addr, addr + nb))
+        if not contains(discovered[reg_type], addr, addr + nb):
+            missing.append((name, socket, reg_type, addr, nb))
+    unknown = {reg_type: subtract(spans, merge(known[reg_type])) for reg_type, spans in discovered.items()}
+    return missing, unknown
+
+
+def _spans_text(spans):
+    return ", ".join(f"{start}" if end - start == 1 else f"{start}-{end - 1}" for start, end in spans) or "none"
+
+
+async def run_scan(scanner, reg_types, start, end):
+    try:
+        return await scanner.scan(reg_types, start, end)
+    finally:
+        scanner.poller.close()
+
+
+def main():
+    from controller import parse_charger
+    from fleet import Charger, FleetPoller
+
+    parser = argparse.ArgumentParser(description="Find the implemented register ranges of a charger")
+    parser.add_argument("charger", help="host or host:port")
+    parser.add_argument("--model", default=DEFAULT_MODEL, choices=available_models(),
+                        help="register map to compare the result with")
+    parser.add_argument("--unit", type=int, help="Modbus unit id, default from the register map")
+    parser.add_argument("--types", default="input,holding", help="input, holding or both")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--end", type=int, default=ADDRESS_SPACE, help="first address not scanned")
+    parser.add_argument("--connections", type=int, default=1, help="connections opened to the device")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="reads in flight per connection")
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--retries", type=int, default=1, help="extra attempts after a read timeout")
+    parser.add_argument("--output", help="write the discovered map and the differences as JSON")
+    args = parser.parse_args()
+
+    types = {"input": RegisterType.INPUT, "holding": RegisterType.HOLDING}
+    try:
+        reg_types = [types[name.strip()] for name in args.types.split(",")]
+    except KeyError as e:
+        parser.error(f"unknown register type {e}")
+    if not 0 <= args.start < args.end <= ADDRESS_SPACE:
+        parser.error(f"--start and --end must lie within 0-{ADDRESS_SPACE}")
+
+    host, port, model = parse_charger(args.charger, args.model)
+    chargers = [Charger(host, port, model, args.unit) for _ in range(args.connections)]
+    poller = FleetPoller(chargers, timeout=args.timeout)
+    scanner = Scanner(poller, chargers, args.window, args.retries)
+    started = time.perf_counter()
+    try:
+        discovered = asyncio.get_event_loop().run_until_complete(run_scan(scanner, reg_types, args.start, args.end))
+    except KeyboardInterrupt:
+        return
+    except Exception as e:
+        sys.exit(f"[ERROR] Scan of {args.charger} failed: {e}")
+    elapsed = time.perf_counter() - started
+
+    register_map = load_map(args.model)
+    missing, unknown = compare(discovered, register_map)
+    for reg_type, spans in discovered.items():
+        print(f"{reg_type.name.lower():<8} readable: {_spans_text(spans)}")
+        print(f"{reg_type.name.lower():<8} not in {register_map.model}: {_spans_text(unknown[reg_type])}")
+    for name, socket, reg_type, addr, nb in missing:
+        print(f"not readable: {name} (socket {socket}, {reg_type.name.lower()} {addr}, {nb} registers)")
+    print(f"{scanner.requests} requests, {scanner.timeouts} timeouts in {elapsed:.1f} s", file=sys.stderr)
+
+    if args.output:
+        report = {
+            "host": args.charger,
+            "unit": chargers[0].unit,
+            "model": register_map.model,
+            "scanned": [args.start, args.end],
+            "readable": {reg_type.value: spans for reg_type, spans in discovered.items()},
+            "unknown": {reg_type.value: spans for reg_type, spans in unknown.items()},
+            "missing": [{"name": name, "socket": socket, "type": reg_type.value, "addr": addr, "nb": nb}
+                        for name, socket, reg_type, addr, nb in missing],
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import time
+
+from registers import POLL_ONCE
+
+SLOW_RESPONSE = 0.5  # seconds per poll before backing off
+MAX_BACKOFF = 8.0
+EARLY_FRACTION = 0.25  # pull registers due soon into the current read
+
+
+class PollScheduler:
+    def __init__(self, intervals, slow_response: float = SLOW_RESPONSE, max_backoff: float = MAX_BACKOFF,
+                 early_fraction: float = EARLY_FRACTION):
+        # intervals: name -> poll interval in seconds, or POLL_ONCE
+        self._intervals = dict(intervals)
+        self._next_due = {name: 0.0 for name in self._intervals}
+        self.slow_response = slow_response
+        self.max_backoff = max_backoff
+        self.early_fraction = early_fraction
+        self.backoff = 1.0
+
+    def interval(self, name):
+        base = self._intervals[name]
+        if base is POLL_ONCE:
+            return None
+        return base * self.backoff
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        names = []
+        for name, next_due in self._next_due.items():
+            interval = self.interval(name) or 0.0
+            if now >= next_due - interval * self.early_fraction:
+                names.append(name)
+        # Nothing strictly due yet means the early ones can wait too
+        if not any(now >= self._next_due[name] for name in names):
+            return []
+        return names
+
+    def complete(self, results, elapsed: float, now=None):
+        # results: name -> True if the register was read successfully
+        now = time.monotonic() if now is None else now
+        if elapsed > self.slow_response or not all(results.values()):
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+        else:
+            self.backoff = max(self.backoff * 0.75, 1.0)
+
+        for name, ok in results.items():
+            if name not in self._next_due:
+                continue
+            interval = self.interval(name)
+            if interval is None:
+                if ok:
+                    del self._next_due[name]
+                    continue
+                interval = self.backoff  # retry a failed one-shot read
+            self._next_due[name] = now + interval
+
+    def next_wakeup(self, now=None):
+        if not self._next_due:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(min(self._next_due.values()) - now, 0.0)
+
+    def reset(self):
+        self._next_due = {name: 0.0 for name in self._intervals}
+        self.backoff = 1.0
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import base64
+import hashlib
+import http.client
+import json
+import os
+import socket
+import struct
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from cache import RegisterCache
+from events import ChangeStream
+from metrics import MetricsServer, registry
+from registers import RegisterType, convert_from
+
+DEFAULT_PORT = 8502
+EVENT_QUEUE_SIZE = 1000  # batches a WebSocket client may fall behind before it is dropped
+CLOSE_TOO_SLOW = 1008  # close code sent to a client that missed events; reconnect for a snapshot
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 502: "Bad Gateway"}
+
+
+def ws_accept(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def _masked(payload, mask):
+    return bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def ws_frame(payload: bytes, opcode=OP_TEXT, mask=None):
+    # Servers send unmasked frames, clients must mask theirs
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    n = len(payload)
+    if n < 126:
+        head.append(mask_bit | n)
+    elif n < 65536:
+        head.append(mask_bit | 126)
+        head += struct.pack(">H", n)
+    else:
+        head.append(mask_bit | 127)
+        head += struct.pack(">Q", n)
+    if mask:
+        head += mask
+        payload = _masked(payload, mask)
+    return bytes(head) + payload
+
+
+def _frame_header(head, read):
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", read(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", read(8))[0]
+    return opcode, length, head[1] & 0x80
+
+
+async def ws_read(reader):
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if head[1] & 0x80 else None
+    payload = await reader.readexactly(length)
+    return opcode, _masked(payload, mask) if mask else payload
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiServer:
+    # Owns the Modbus connections of a FleetPoller; clients get the latest values,
+    # raw register words and change events, and their writes go through the poller
+    def __init__(self, poller, host: str = "127.0.0.1", port: int = DEFAULT_PORT, changes=None):
+        self.poller = poller
+        self.host = host
+        self.port = port
+        self.changes = changes if changes is not None else ChangeStream()
+        self.chargers = {charger.key: charger for charger in poller.chargers}
+        self.results = {}  # charger key -> last PollResult
+        self.images = {}  # charger key -> {(reg_type, addr): word}
+        self.clients = 0
+
+    async def run(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        try:
+            async for result in self.poller.stream():
+                self.update(result)
+        finally:
+            server.close()
+            await server.wait_closed()
+            self.poller.close()
+
+    def update(self, result):
+        key = result.charger.key
+        self.results[key] = result
+        if result.error is None:
+            image = self.images.setdefault(key, {})
+            for reg_type, addr, words in result.blocks:
+                for i, word in enumerate(words):
+                    image[(reg_type, addr + i)] = word
+            self.changes.feed(key, result.values, result.timestamp)
+
+    def charger(self, query):
+        key = query.get("charger")
+        if key is None and len(self.chargers) == 1:
+            key = next(iter(self.chargers))
+        charger = self.chargers.get(key)
+        if charger is None:
+            raise ApiError(404, f"Unknown charger {key!r}")
+        return charger
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                url = urlsplit(target)
+                query = dict(parse_qsl(url.query))
+                if url.path == "/events" and headers.get("upgrade", "").lower() == "websocket":
+                    await self.stream_events(reader, writer, headers, query)
+                    break
+                try:
+                    status, payload = 200, await self.route(method, url.path, query, body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 502, {"error": str(e)}
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def route(self, method, path, query, body):
+        if path == "/chargers" and method == "GET":
+            return [self.describe(charger) for charger in self.chargers.values()]
+        if path == "/values" and method == "GET":
+            keys = [self.charger(query).key] if "charger" in query else list(self.chargers)
+            return {key: self.values(key) for key in keys}
+        if path == "/registers" and method == "GET":
+            return {"words": self.words(self.charger(query), query)}
+        if path == "/write" and method == "POST":
+            return await self.write(self._request(body))
+        if path == "/setpoints" and method == "POST":
+            return await self.setpoints(self._request(body))
+        if path in ("/chargers", "/values", "/registers", "/write", "/setpoints"):
+            raise ApiError(405, f"{method} not allowed on {path}")
+        raise ApiError(404, f"No such endpoint {path}")
+
+    def _request(self, body):
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError as e:
+            raise ApiError(400, f"Invalid JSON: {e}")
+        if not isinstance(request, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return request
+
+    def describe(self, charger):
+        result = self.results.get(charger.key)
+        return {
+            "charger": charger.key,
+            "model": charger.register_map.model,
+            "connected": charger.is_connected(),
+            "last_poll": result.timestamp if result is not None else None,
+            "error": str(result.error) if result is not None and result.error is not None else None,
+        }
+
+    def values(self, key):
+        result = self.results.get(key)
+        if result is None:
+            return {"timestamp": None, "values": {}}
+        values = {}
+        for (name, socket_no), text in result.values.items():
+            values.setdefault(name, {})[str(socket_no)] = text
+        return {"timestamp": result.timestamp, "values": values}
+
+    def words(self, charger, query):
+        try:
+            reg_type = RegisterType(query.get("type", RegisterType.INPUT.value))
+            addr, count = int(query["addr"]), int(query.get("count", 1))
+        except (KeyError, ValueError):
+            raise ApiError(400, "registers needs addr, count and type (R or R/W)")
+        image = self.images.get(charger.key, {})
+        words = [image.get((reg_type, addr + i)) for i in range(count)]
+        if None in words:
+            raise ApiError(404, f"Registers {addr}..{addr + count - 1} are not polled")
+        return words
+
+    def _words(self, charger, request):
+        # (addr, value) for FleetPoller.write: an int for one word, a list for FC16
+        # Bad input is the client's fault (400); only device and link failures are 502
+        value = request["value"]
+        try:
+            if "register" in request:
+                d = charger.register_map.get(request["register"])
+                if d is None:
+                    raise ApiError(404, f"Unknown register {request['register']!r}")
+                addr = d.socket2_addr if int(request.get("socket", 1)) == 2 else d.addr
+                if addr is None:
+                    raise ApiError(400, f"{d.name} has no socket 2 on {charger.key}")
+                words = convert_from(d.data_type, d.nb, value, charger.register_map.word_order)
+                return addr, words[0] if len(words) == 1 else words
+            return int(request["addr"]), [int(v) for v in value] if isinstance(value, list) else int(value)
+        except (TypeError, ValueError) as e:
+            raise ApiError(400, f"Bad value {value!r}: {e}")
+
+    def _written(self, charger, addr, value):
+        # Pick up the new value on the next poll instead of serving stale words
+        image = self.images.get(charger.key, {})
+        for i in range(len(value) if isinstance(value, list) else 1):
+            image.pop((RegisterType.HOLDING, addr + i), None)
+
+    async def write(self, request):
+        charger = self.charger(request)
+        if "value" not in request or not ("register" in request or "addr" in request):
+            raise ApiError(400, "write needs charger, register or addr, and value")
+        addr, value = self._words(charger, request)
+        await self.poller.write(charger, addr, value)
+        self._written(charger, addr, value)
+        return {"ok": True}
+
+    async def setpoints(self, request):
+        # {"register": name, "socket": 1, "values": {charger: value}} or "value" for all chargers
+        name = request.get("register", "Charging Current")
+        socket_no = request.get("socket", 1)
+        if isinstance(request.get("values"), dict):
+            setpoints = {self.charger({"charger": key}): value for key, value in request["values"].items()}
+        elif "value" in request:
+            setpoints = {charger: request["value"] for charger in self.chargers.values()}
+        else:
+            raise ApiError(400, "setpoints needs values or value")
+        # Check every value before writing any of them
+        words = {charger: self._words(charger, {"register": name, "socket": socket_no, "value": value})
+                 for charger, value in setpoints.items()}
+        results = await self.poller.write_all(setpoints, name, int(socket_no))
+        for charger in setpoints:
+            if results[charger.key] is None:
+                self._written(charger, *words[charger])
+        return {key: "ok" if error is None else str(error) for key, error in results.items()}
+
+    # WebSocket
+
+    async def stream_events(self, reader, writer, headers, query):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {ws_accept(key)}\r\n\r\n").encode())
+        registers = query["registers"].split(",") if query.get("registers") else None
+        sources = [self.charger(query).key] if "charger" in query else None
+        queue = asyncio.Queue()
+        lagging = False
+
+        def deliver(events):
+            # Called on the loop thread by ChangeStream.feed. A client that can't keep
+            # up is closed rather than silently skipping events; None marks the spot
+            nonlocal lagging
+            if lagging:
+                return
+            if queue.qsize() >= EVENT_QUEUE_SIZE:
+                lagging = True
+                events = None
+            queue.put_nowait(events)
+
+        if query.get("snapshot") != "0":
+            # Current state first, so a client never starts blind
+            snapshot = [
+                {"timestamp": result.timestamp, "source": source, "register": name, "socket": socket_no,
+                 "value": text, "previous": None, "heartbeat": False}
+                for source, result in self.results.items() if sources is None or source in sources
+                for (name, socket_no), text in result.values.items() if registers is None or name in registers
+            ]
+            writer.write(ws_frame(json.dumps(snapshot).encode()))
+
+        token = self.changes.subscribe(deliver, registers, sources)
+        receive = asyncio.ensure_future(self._ws_receive(reader, writer))
+        try:
+            while not receive.done():
+                get = asyncio.ensure_future(queue.get())
+                await asyncio.wait([get, receive], return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    break
+                events = get.result()
+                if events is None:
+                    writer.write(ws_frame(struct.pack(">H", CLOSE_TOO_SLOW) + b"Too slow, events were dropped",
+                                          OP_CLOSE))
+                    await writer.drain()
+                    break
+                writer.write(ws_frame(json.dumps([e._asdict() for e in events]).encode()))
+                await writer.drain()
+        finally:
+            self.changes.unsubscribe(token)
+            receive.cancel()
+
+    async def _ws_receive(self, reader, writer):
+        while True:
+            opcode, payload = await ws_read(reader)
+            if opcode == OP_CLOSE:
+                writer.write(ws_frame(payload[:2], OP_CLOSE))
+                return
+            if opcode == OP_PING:
+                writer.write(ws_frame(payload, OP_PONG))
+
+
+class ApiClient:
+    def __init__(self, url: str = f"http://127.0.0.1:{DEFAULT_PORT}", timeout: float = 3.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self._conn = None
+
+    def _request(self, method, path, query=None, body=None):
+        if query:
+            path += "?" + urlencode({k: v for k, v in query.items() if v is not None})
+        data = json.dumps(body).encode() if body is not None else None
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, data, {"Content-Type": "application/json"} if data else {})
+                response = self._conn.getresponse()
+                payload = json.loads(response.read() or b"null")
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # Kept-alive connection was closed by the server, retry once on a new one
+                self.close()
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise ApiError(response.status, payload.get("error", response.reason))
+        return payload
+
+    def chargers(self):
+        return self._request("GET", "/chargers")
+
+    def values(self, charger=None):
+        return self._request("GET", "/values", {"charger": charger})
+
+    def registers(self, reg_type, addr, count, charger=None):
+        return self._request("GET", "/registers", {"charger": charger, "type": reg_type.value,
+                                                   "addr": addr, "count": count})["words"]
+
+    def setpoints(self, values, register="Charging Current", socket=1):
+        # values: {charger key: value}, or one value for every charger
+        body = {"register": register, "socket": socket}
+        body["values" if isinstance(values, dict) else "value"] = values
+        return self._request("POST", "/setpoints", body=body)
+
+    def write(self, value, charger=None, addr=None, register=None, socket=1):
+        body = {"value": value, "socket": socket}
+        for name, v in (("charger", charger), ("addr", addr), ("register", register)):
+            if v is not None:
+                body[name] = v
+        return self._request("POST", "/write", body=body)
+
+    def events(self, registers=None, charger=None, snapshot=True):
+        # Yields lists of event dicts until the server closes the stream; raises
+        # ConnectionError if it was dropped for falling behind (events were missed)
+        query = {"charger": charger, "registers": ",".join(registers) if registers else None,
+                 "snapshot": None if snapshot else "0"}
+        path = "/events?" + urlencode({k: v for k, v in query.items() if v is not None})
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        sock.settimeout(None)
+        sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        stream = sock.makefile("rb")
+        try:
+            status = stream.readline()
+            if b" 101 " not in status:
+                raise ApiError(400, f"Event stream refused: {status.decode().strip()}")
+            while stream.readline() not in (b"\r\n", b""):
+                pass
+
+            def read(n):
+                data = stream.read(n)
+                if len(data) < n:
+                    raise ConnectionError("Event stream closed")
+                return data
+
+            while True:
+                opcode, length, _ = _frame_header(read(2), read)
+                payload = read(length)
+                if opcode == OP_CLOSE:
+                    if payload[:2] == struct.pack(">H", CLOSE_TOO_SLOW):
+                        raise ConnectionError(f"Event stream closed: {payload[2:].decode(errors='replace')}")
+                    return
+                if opcode == OP_PING:
+                    sock.sendall(ws_frame(payload, OP_PONG, os.urandom(4)))
+                elif opcode == OP_TEXT:
+                    yield json.loads(payload)
+        finally:
+            stream.close()
+            sock.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class RemoteController:
+    # Stands in for Controller in the GUI: reads come from the server's last poll,
+    # writes are forwarded to the server's connection. connect() selects the charger.
+    def __init__(self, url: str):
+        self.api = ApiClient(url)
+        self.cache = RegisterCache()
+        self.metrics = registry.connection(f"api:{url}")
+        self.charger = None
+
+    def connect(self, host: str, port: int, timeout: int):
+        self.cache.invalidate()
+        self.api.timeout = timeout
+        self.charger = f"{host}:{port}"
+        self.metrics.label = f"api:{self.charger}"
+        try:
+            return any(c["charger"] == self.charger for c in self.api.chargers())
+        except (OSError, ApiError) as e:
+            print(f"[ERROR] API server unavailable: {e}")
+            return False
+
+    def disconnect(self):
+        self.cache.invalidate()
+        self.charger = None
+        self.api.close()
+
+    def refresh(self):
+        self.cache.invalidate()
+
+    def is_connected(self):
+        return self.charger is not None
+
+    def _read(self, reg_type, addr, length):
+        try:
+            return self.api.registers(reg_type, addr, length, self.charger)
+        except (OSError, ApiError) as e:
+            print(f"[ERROR] Failed to read registers from addr {addr}: {e}")
+            return None
+
+    def read_input(self, addr, length, timeout=None, ttl=None):
+        return self._read(RegisterType.INPUT, addr, length)
+
+    def read_holding(self, addr, length, timeout=None, ttl=None):
+        return self._read(RegisterType.HOLDING, addr, length) or []
+
+    def write(self, addr, data, timeout=None):
+        self.cache.invalidate((RegisterType.HOLDING, addr, 1))
+        return self.api.write(data, self.charger, addr=addr)
+
+    def write_many(self, addr, values, timeout=None):
+        values = list(values)
+        self.cache.invalidate((RegisterType.HOLDING, addr, len(values)))
+        return self.api.write(values, self.charger, addr=addr)
+
+    def write_batch(self, writes, timeout=None):
+        return {addr: self.write_many(addr, values) for addr, values in writes.items()}
+
+
+def main():
+    from controller import parse_charger
+    from fleet import Charger, FleetPoller
+    from registers import available_models, load_map
+
+    parser = argparse.ArgumentParser(description="Share one set of Modbus connections with local clients")
+    parser.add_argument("chargers", nargs="+", help="host or host:port of each charger")
+    parser.add_argument("--model", default="EVC04", choices=available_models())
+    parser.add_argument("--host", default="127.0.0.1", help="API address, keep it local")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=3.0)
+    parser.add_argument("--max-silence", type=float, default=300.0)
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:<port>/metrics")
+    args = parser.parse_args()
+
+    chargers = [Charger(*parse_charger(text, args.model)) for text in args.chargers]
+    poller = FleetPoller(chargers, interval=args.interval, timeout=args.timeout)
+    server = ApiServer(poller, args.host, args.port, ChangeStream(load_map(args.model), args.max_silence))
+    poller.start_heartbeats()
+    if args.metrics_port:
+        MetricsServer(args.metrics_port).start()
+    print(f"Serving {len(chargers)} charger(s) on http://{args.host}:{args.port}")
+    try:
+        asyncio.get_event_loop().run_until_complete(server.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
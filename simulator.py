@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import functools
+import random
+import time
+
+from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext, ModbusSparseDataBlock
+from pymodbus.pdu import ModbusExceptions
+from pymodbus.server.async_io import ModbusConnectedRequestHandler, ModbusTcpServer
+
+from registers import RegisterType, convert_from, load_map
+
+FC_HOLDING = 3
+FC_INPUT = 4
+TICK = 0.25
+
+IDENTITY = {
+    "Serial Number": "SIM{port:06d}",
+    "Chargepoint ID": "SIM-CP-{port}",
+    "Brand": "Simulator",
+    "Model": "{model}",
+    "Firmware Version": "sim-1.0.0",
+}
+
+
+class FaultProfile:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, drop_rate: float = 0.0,
+                 error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate  # requests that never get an answer
+        self.error_rate = error_rate  # requests answered with SlaveBusy
+
+    def delay(self):
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+
+
+class SocketModel:
+    # Scripted charging session: idle -> plugged -> charging -> finished -> idle
+    IDLE, PLUGGED, CHARGING, FINISHED = range(4)
+
+    def __init__(self, phases: int = 3, max_current: int = 32, session_length: float = 120.0):
+        self.phases = phases
+        self.max_current = max_current
+        self.session_length = session_length
+        self.state = self.IDLE
+        self.state_since = time.time()
+        self.currents = [0.0, 0.0, 0.0]
+        self.voltages = [230.0, 230.0, 230.0]
+        self.meter = random.randint(0, 1000000)
+        self.session_energy = 0.0
+        self.session_start = 0
+        self.session_end = 0
+
+    def step(self, now: float, dt: float, setpoint: int):
+        elapsed = now - self.state_since
+        if self.state == self.IDLE and elapsed > random.uniform(5, 30):
+            self._enter(self.PLUGGED, now)
+        elif self.state == self.PLUGGED and elapsed > 2:
+            self.session_start = int(now)
+            self.session_energy = 0.0
+            self._enter(self.CHARGING, now)
+        elif self.state == self.CHARGING and elapsed > self.session_length:
+            self.session_end = int(now)
+            self._enter(self.FINISHED, now)
+        elif self.state == self.FINISHED and elapsed > 5:
+            self._enter(self.IDLE, now)
+
+        target = min(setpoint, self.max_current) if self.state == self.CHARGING else 0
+        for i in range(3):
+            self.voltages[i] = 230.0 + random.uniform(-3, 3)
+            if i < self.phases and target:
+                self.currents[i] = max(0.0, min(target, self.currents[i] + random.uniform(-0.5, 1.0)))
+            else:
+                self.currents[i] = 0.0
+        energy = sum(self.power_per_phase()) * dt / 3600.0
+        self.meter += energy
+        self.session_energy += energy
+
+    def _enter(self, state, now):
+        self.state = state
+        self.state_since = now
+
+    def power_per_phase(self):
+        return [v * i for v, i in zip(self.voltages, self.currents)]
+
+    def values(self):
+        powers = self.power_per_phase()
+        plugged = self.state != self.IDLE
+        return {
+            "Chargepoint State": self.state,
+            "Charging State": 1 if self.state == self.CHARGING else 0,
+            "Equipment State": 1,
+            "Cable State": 3 if plugged else 0,
+            "EVSE Fault Code": 0,
+            "Current L1": int(self.currents[0] * 1000),
+            "Current L2": int(self.currents[1] * 1000),
+            "Current L3": int(self.currents[2] * 1000),
+            "Voltage L1": int(self.voltages[0]),
+            "Voltage L2": int(self.voltages[1]),
+            "Voltage L3": int(self.voltages[2]),
+            "Active Power Total": int(sum(powers)),
+            "Active Power L1": int(powers[0]),
+            "Active Power L2": int(powers[1]),
+            "Active Power L3": int(powers[2]),
+            "Meter Reading": int(self.meter),
+            "Session Max Current": self.max_current if plugged else 0,
+            "EVSE Min Current": 6,
+            "EVSE Max Current": self.max_current,
+            "Cable Max Current": 32 if plugged else 0,
+            "Session Energy": int(self.session_energy),
+            "Session Start Time": self.session_start,
+            "Session End Time": self.session_end,
+            "Session RFID Tag": "04A1B2C3D4" if plugged else "",
+        }
+
+
+class SimulatedCharger:
+    def __init__(self, port: int, model: str = "EVC04", faults: FaultProfile = None, session_length: float = 120.0):
+        self.port = port
+        self.register_map = load_map(model)
+        self.faults = faults or FaultProfile()
+        evc10 = any(d.socket2_addr for d in self.register_map.defs)
+        self.sockets = [SocketModel(session_length=session_length)]
+        if evc10:
+            self.sockets.append(SocketModel(session_length=session_length))
+        self.last_alive = time.time()
+        self.context = self._build_context()
+        self._write_identity()
+
+    def _build_context(self):
+        # Only the areas covered by the map (and the gaps the read planner bridges) are implemented,
+        # everything else answers IllegalAddress like a real charger
+        areas = {RegisterType.INPUT: {}, RegisterType.HOLDING: {}}
+        for block in self.register_map.plan():
+            for addr in range(block.addr, block.end()):
+                areas[block.reg_type][addr] = 0
+        regs = self.register_map
+        areas[RegisterType.HOLDING][regs["Failsafe Current"].addr] = 6
+        areas[RegisterType.HOLDING][regs["Failsafe Timeout"].addr] = 20
+        areas[RegisterType.HOLDING][regs["Charging Current"].addr] = 32
+        slave = ModbusSlaveContext(
+            ir=ModbusSparseDataBlock(areas[RegisterType.INPUT]),
+            hr=ModbusSparseDataBlock(areas[RegisterType.HOLDING]),
+            zero_mode=True,
+        )
+        return ModbusServerContext(slaves=slave, single=True)
+
+    def set_value(self, name, value, socket=1):
+        d = self.register_map[name]
+        addr = d.addr if socket == 1 else d.socket2_addr
+        if addr is None:
+            return
+        fc = FC_INPUT if d.reg_type == RegisterType.INPUT else FC_HOLDING
+        self.context[0].setValues(fc, addr, convert_from(d.data_type, d.nb, value, self.register_map.word_order))
+
+    def get_value(self, name):
+        d = self.register_map[name]
+        fc = FC_INPUT if d.reg_type == RegisterType.INPUT else FC_HOLDING
+        return self.context[0].getValues(fc, d.addr, d.nb)[0]
+
+    def _write_identity(self):
+        for name, template in IDENTITY.items():
+            self.set_value(name, template.format(port=self.port, model=self.register_map.model))
+        self.set_value("Chargepoint Power", 22000)
+        self.set_value("Chargepoint Power", 22000, socket=2)
+        self.set_value("Number of Phases", 3)
+
+    def step(self, now: float, dt: float):
+        # Fall back to the failsafe current when the alive register is not refreshed in time
+        if self.get_value("Alive Register"):
+            self.last_alive = now
+            self.set_value("Alive Register", 0)
+        setpoint = self.get_value("Charging Current")
+        if now - self.last_alive > self.get_value("Failsafe Timeout"):
+            setpoint = self.get_value("Failsafe Current")
+
+        self.set_value("Date", int(time.strftime("%y%m%d", time.localtime(now))))
+        self.set_value("Time", int(time.strftime("%H%M%S", time.localtime(now))))
+        for socket, model in enumerate(self.sockets, start=1):
+            model.step(now, dt, setpoint)
+            for name, value in model.values().items():
+                self.set_value(name, value, socket)
+
+
+class SimulatorRequestHandler(ModbusConnectedRequestHandler):
+    def execute(self, request, *addr):
+        faults = self.server.simulator.faults
+        if faults.drop_rate and random.random() < faults.drop_rate:
+            return
+        if faults.error_rate and random.random() < faults.error_rate:
+            response = request.doException(ModbusExceptions.SlaveBusy)
+            response.transaction_id = request.transaction_id
+            response.unit_id = request.unit_id
+            self.send(response, *addr)
+            return
+        delay = faults.delay()
+        if delay:
+            execute = functools.partial(ModbusConnectedRequestHandler.execute, self, request, *addr)
+            asyncio.get_event_loop().call_later(delay, execute)
+        else:
+            super().execute(request, *addr)
+
+
+async def run_simulators(chargers, host: str = "127.0.0.1"):
+    loop = asyncio.get_event_loop()
+    servers = []
+    for charger in chargers:
+        server = ModbusTcpServer(charger.context, address=(host, charger.port),
+                                 handler=SimulatorRequestHandler, allow_reuse_address=True, loop=loop)
+        server.simulator = charger
+        servers.append(server)
+
+    async def tick():
+        last = time.time()
+        while True:
+            await asyncio.sleep(TICK)
+            now = time.time()
+            for charger in chargers:
+                charger.step(now, now - last)
+            last = now
+
+    await asyncio.gather(tick(), *(server.serve_forever() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate EVC04/EVC10 chargers over Modbus TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=5020)
+    parser.add_argument("--count", type=int, default=1, help="number of chargers, one port each")
+    parser.add_argument("--model", default="EVC04")
+    parser.add_argument("--session-length", type=float, default=120.0, help="seconds per charging session")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of requests left unanswered")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with SlaveBusy")
+    args = parser.parse_args()
+
+    faults = FaultProfile(args.latency, args.jitter, args.drop_rate, args.error_rate)
+    chargers = [
+        SimulatedCharger(args.base_port + i, args.model, faults, args.session_length)
+        for i in range(args.count)
+    ]
+    print(f"Serving {args.count} {args.model} simulator(s) on {args.host}:{args.base_port}-{args.base_port + args.count - 1}")
+    try:
+        asyncio.get_event_loop().run_until_complete(run_simulators(chargers, args.host))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
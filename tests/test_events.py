@@ -0,0 +1,12 @@
+from events import ChangeFilter
+
+
+def test_heartbeat_sends_latest_value():
+    changes = ChangeFilter(max_silence=10, deadbands={"Voltage L1": (2.0, 0.0)})
+    assert changes.changes("c", {("Voltage L1", 1): "230"}, 0)[0].value == "230"
+    assert changes.changes("c", {("Voltage L1", 1): "231"}, 5) == []
+    heartbeat, = changes.changes("c", {("Voltage L1", 1): "232"}, 11)
+    assert heartbeat.heartbeat and heartbeat.value == "232" and heartbeat.previous == "230"
+    # The heartbeat value is the new reference for the deadband
+    assert changes.changes("c", {("Voltage L1", 1): "234"}, 12) == []
+    assert changes.latest() == {("c", "Voltage L1", 1): "232"}
@@ -0,0 +1,18 @@
+import json
+
+from export import JsonLinesWriter
+
+
+def row(i):
+    return {"timestamp": float(i), "charger": "c", "register": "r", "socket": 1, "value": str(i)}
+
+
+def test_rotations_in_the_same_second_keep_every_file(tmp_path):
+    writer = JsonLinesWriter(str(tmp_path / "out.jsonl"), batch_size=1, rotate_bytes=1)
+    for i in range(3):
+        writer.write(row(i))
+    writer.close()
+    files = sorted(tmp_path.iterdir())
+    assert len(files) == 3
+    values = sorted(json.loads(line)["value"] for f in files for line in f.read_text().splitlines())
+    assert values == ["0", "1", "2"]
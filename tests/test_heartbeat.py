@@ -0,0 +1,36 @@
+import threading
+
+from heartbeat import HeartbeatScheduler
+
+
+def test_beats_fire_in_due_order():
+    scheduler = HeartbeatScheduler("test-heartbeat")
+    order = []
+    done = threading.Event()
+
+    def beat(key):
+        def send():
+            order.append(key)
+            if len(order) == 4:
+                done.set()
+            return False  # one beat each
+        return send
+
+    scheduler.register("slow", beat("slow"), interval=0.15, immediate=False)
+    scheduler.register("fast", beat("fast"), interval=0.05, immediate=False)
+    scheduler.register("middle", beat("middle"), interval=0.1, immediate=False)
+    scheduler.register("now", beat("now"), interval=1.0)
+    assert done.wait(2.0)
+    assert order == ["now", "fast", "middle", "slow"]
+    assert len(scheduler) == 0
+
+
+def test_unregistered_beat_is_skipped():
+    scheduler = HeartbeatScheduler("test-heartbeat")
+    sent = []
+    done = threading.Event()
+    scheduler.register("gone", lambda: sent.append("gone"), interval=0.05, immediate=False)
+    scheduler.register("kept", lambda: sent.append("kept") or done.set() or False, interval=0.1, immediate=False)
+    scheduler.unregister("gone")
+    assert done.wait(2.0)
+    assert sent == ["kept"]
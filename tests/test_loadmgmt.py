@@ -0,0 +1,55 @@
+from loadmgmt import Demand, allocate
+
+
+def test_pause_only_chargers_on_overloaded_phase():
+    demands = [
+        Demand("a", (0, 1, 2), 6, 32),
+        Demand("b", (0,), 6, 32),
+        Demand("c", (1,), 6, 32),
+    ]
+    allocation = allocate(demands, [11, 30, 30])
+    assert allocation["b"] == 0
+    assert allocation["a"] == 11
+    assert allocation["c"] == 19
+
+
+def test_paused_charger_taken_back_when_it_fits():
+    # Pausing c (L1+L2) isn't enough for L1, b goes too; then c fits again
+    demands = [
+        Demand("a", (0,), 6, 32),
+        Demand("b", (0,), 10, 32),
+        Demand("c", (0, 1), 6, 32),
+    ]
+    allocation = allocate(demands, [13, 30, 30])
+    assert allocation["b"] == 0
+    assert allocation["a"] >= 6 and allocation["c"] >= 6
+    assert allocation["a"] + allocation["c"] <= 13
+
+
+def test_within_limits():
+    demands = [Demand(k, (0, 1, 2), 6, 16) for k in "abc"]
+    allocation = allocate(demands, [32, 32, 32])
+    assert sorted(allocation.values()) == [10, 11, 11]
+
+
+def test_leftover_goes_to_chargers_that_can_take_it():
+    demands = [
+        Demand("0", (2,), 10, 27),
+        Demand("1", (0, 1), 6, 13),
+        Demand("2", (1,), 6, 18),
+        Demand("3", (0,), 6, 23),
+        Demand("4", (0, 1, 2), 6, 16),
+    ]
+    allocation = allocate(demands, [20, 26, 7])
+    assert allocation["0"] == 0
+    assert allocation["1"] + allocation["3"] + allocation["4"] == 20  # L1 full
+    load = [0, 0, 0]
+    for d in demands:
+        for p in d.phases:
+            load[p] += allocation[d.key]
+    assert load[0] <= 20 and load[1] <= 26 and load[2] <= 7
+    for d in demands:
+        if allocation[d.key]:
+            assert d.lo <= allocation[d.key] <= d.hi
+            # Nobody could take one more amp
+            assert allocation[d.key] == d.hi or any(load[p] == [20, 26, 7][p] for p in d.phases)
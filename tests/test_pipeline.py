@@ -0,0 +1,97 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+from pipeline import MBAP, READ_PDU, pipeline
+
+
+def device(sock, answer, batch=1):
+    # Fake device: collects `batch` requests, then answers them through answer(tid, fc, addr, count),
+    # which returns the PDU to send or None to leave the request unanswered
+    def run():
+        pending = []
+        while True:
+            header = sock.recv(MBAP.size)
+            if not header:
+                return
+            tid, _, length, unit = MBAP.unpack(header)
+            fc, addr, count = READ_PDU.unpack(sock.recv(length - 1))
+            pending.append((tid, fc, addr, count))
+            if len(pending) < batch:
+                continue
+            for tid, fc, addr, count in reversed(pending):
+                pdu = answer(tid, fc, addr, count)
+                if pdu is not None:
+                    sock.sendall(MBAP.pack(tid, 0, len(pdu) + 1, unit) + pdu)
+            pending = []
+    threading.Thread(target=run, daemon=True).start()
+
+
+def registers(fc, addr, count):
+    return bytes([fc, 2 * count]) + struct.pack(f">{count}H", *range(addr, addr + count))
+
+
+def test_out_of_order_responses_match_their_requests():
+    client, server = socket.socketpair()
+    device(server, lambda tid, fc, addr, count: registers(fc, addr, count), batch=3)
+    requests = [(4, 0, 3), (3, 10, 2), (4, 20, 1)]
+    results = pipeline(client, requests, window=3, timeout=1)
+    assert [r.registers for r in results] == [[0, 1, 2], [10, 11], [20]]
+    assert [r.function_code for r in results] == [4, 3, 4]
+
+
+def test_exception_response():
+    client, server = socket.socketpair()
+    device(server, lambda tid, fc, addr, count: bytes([fc | 0x80, 2]))
+    result, = pipeline(client, [(4, 0, 1)], timeout=1)
+    assert result.isError() and result.exception_code == 2
+
+
+@pytest.mark.parametrize("pdu", [
+    bytes([3, 2, 0, 1]),  # function code of another request
+    bytes([4, 4, 0, 1, 0, 2]),  # byte count for two registers, one asked
+    bytes([4, 2, 0]),  # PDU shorter than its byte count
+])
+def test_mismatched_response_is_rejected(pdu):
+    client, server = socket.socketpair()
+    device(server, lambda tid, fc, addr, count: pdu)
+    with pytest.raises(ConnectionError):
+        pipeline(client, [(4, 0, 1)], timeout=1)
+    assert client.fileno() == -1
+
+
+def test_malformed_length_is_rejected():
+    client, server = socket.socketpair()
+
+    def run():
+        tid = MBAP.unpack(server.recv(MBAP.size + READ_PDU.size)[:MBAP.size])[0]
+        server.sendall(MBAP.pack(tid, 0, 0, 0))
+    threading.Thread(target=run, daemon=True).start()
+    with pytest.raises(ConnectionError):
+        pipeline(client, [(4, 0, 1)], timeout=1)
+
+
+def test_timeout_with_requests_in_flight_closes_the_socket():
+    client, server = socket.socketpair()
+    # Only even addresses are answered
+    device(server, lambda tid, fc, addr, count: registers(fc, addr, count) if addr % 2 == 0 else None)
+    answered = []
+    with pytest.raises(socket.timeout):
+        pipeline(client, [(4, 0, 1), (4, 1, 1), (4, 2, 1)], window=3, timeout=0.2,
+                 received=lambda i, response: answered.append(i))
+    assert sorted(answered) == [0, 2]
+    assert client.fileno() == -1
+
+
+def test_late_answer_to_unknown_tid_is_skipped():
+    client, server = socket.socketpair()
+
+    def answer(tid, fc, addr, count):
+        # A reply to some earlier, abandoned request first, then the real one
+        server.sendall(MBAP.pack((tid + 100) & 0xFFFF, 0, 3, 0) + bytes([fc, 0]))
+        return registers(fc, addr, count)
+    device(server, answer)
+    result, = pipeline(client, [(4, 7, 1)], timeout=1)
+    assert result.registers == [7]
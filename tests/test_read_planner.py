@@ -0,0 +1,50 @@
+from read_planner import MAX_READ_COUNT, ReadBlock, plan_reads
+from registers import RegisterType
+
+INPUT, HOLDING = RegisterType.INPUT, RegisterType.HOLDING
+
+
+def spans(blocks):
+    return [(block.reg_type, block.addr, block.nb) for block in blocks]
+
+
+def test_gaps_up_to_max_gap_are_bridged():
+    entries = [("a", INPUT, 100, 2), ("b", INPUT, 106, 1), ("c", INPUT, 112, 1)]
+    # 106 is 4 past the end of a (102), 112 is 5 past the end of b (107)
+    assert spans(plan_reads(entries, max_gap=4)) == [(INPUT, 100, 7), (INPUT, 112, 1)]
+    assert spans(plan_reads(entries, max_gap=5)) == [(INPUT, 100, 13)]
+    assert spans(plan_reads(entries, max_gap=0)) == [(INPUT, 100, 2), (INPUT, 106, 1), (INPUT, 112, 1)]
+
+
+def test_blocks_split_at_max_count():
+    entries = [(i, INPUT, i * 10, 10) for i in range(30)]  # 300 contiguous registers
+    blocks = plan_reads(entries)
+    assert all(block.nb <= MAX_READ_COUNT for block in blocks)
+    assert spans(blocks) == [(INPUT, 0, 120), (INPUT, 120, 120), (INPUT, 240, 60)]
+    # A register is never cut in two
+    assert sum(len(block.entries) for block in blocks) == 30
+    assert spans(plan_reads(entries, max_count=25)) == [(INPUT, i, 20) for i in range(0, 300, 20)]
+
+
+def test_register_types_are_planned_separately():
+    entries = [("a", INPUT, 100, 1), ("b", HOLDING, 101, 1), ("c", INPUT, 102, 1), ("d", HOLDING, 100, 1)]
+    blocks = plan_reads(entries)
+    assert sorted(spans(blocks), key=lambda s: s[0].value) == [(INPUT, 100, 3), (HOLDING, 100, 2)]
+    for block in blocks:
+        assert all(key in ("a", "c") for key, _, _ in block.entries) == (block.reg_type == INPUT)
+
+
+def test_unsorted_and_overlapping_entries():
+    entries = [("b", INPUT, 1004, 2), ("a", INPUT, 1000, 2), ("both", INPUT, 1000, 4)]
+    block, = plan_reads(entries)
+    assert (block.addr, block.nb) == (1000, 6)
+
+
+def test_slice_and_split():
+    block = ReadBlock(INPUT, 100)
+    block.add("a", 100, 2)
+    block.add("b", 104, 1)
+    data = [10, 11, 12, 13, 14]
+    assert block.nb == 5 and block.end() == 105
+    assert block.slice(data, 101, 2) == [11, 12]
+    assert block.split(data) == {"a": [10, 11], "b": [14]}
@@ -0,0 +1,45 @@
+from decoder import decoder_for
+from registers import PLAN_CACHE_SIZE, DataType, compile_map, convert_from, convert_to
+
+LITTLE = {
+    "model": "TEST",
+    "word_order": "little",
+    "registers": [
+        {"name": "Energy", "addr": 10, "nb": 2, "type": "R", "data_type": "uint32"},
+        {"name": "State", "addr": 12, "nb": 1, "type": "R", "data_type": "uint16"},
+    ],
+}
+
+
+def test_uint32_round_trip_little_endian():
+    register_map = compile_map("TEST", LITTLE)
+    d = register_map["Energy"]
+    words = convert_from(d.data_type, d.nb, 0x12345678, register_map.word_order)
+    assert words == [0x5678, 0x1234]
+    assert convert_to(d.data_type, words, register_map.word_order) == str(0x12345678)
+
+
+def test_convert_to_matches_block_decoder():
+    register_map = compile_map("TEST", LITTLE)
+    block, = register_map.plan()
+    words = convert_from(DataType.UINT32, 2, 70000, "little") + [3]
+    decoded = decoder_for(block, register_map).decode_text(words)
+    assert decoded[("Energy", 1)] == convert_to(DataType.UINT32, words[:2], register_map.word_order) == "70000"
+
+
+def test_uint32_big_endian_default():
+    assert convert_to(DataType.UINT32, convert_from(DataType.UINT32, 2, 70000)) == "70000"
+
+
+def test_plan_from_generator():
+    register_map = compile_map("TEST", LITTLE)
+    blocks = register_map.plan(name for name in ["Energy", "State"])
+    assert [block.nb for block in blocks] == [3]
+    assert register_map.plan(["Energy", "State"]) is blocks
+
+
+def test_plan_cache_is_bounded():
+    register_map = compile_map("TEST", LITTLE)
+    for gap in range(PLAN_CACHE_SIZE * 2):
+        register_map.plan(["Energy"], gap)
+    assert len(register_map._plans) == PLAN_CACHE_SIZE
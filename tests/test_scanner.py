@@ -0,0 +1,38 @@
+from registers import DEFAULT_MODEL, RegisterType, load_map
+from scanner import compare, contains, merge, subtract
+
+
+def test_merge_joins_overlapping_and_touching_spans():
+    assert merge([(10, 20), (0, 5), (5, 8), (15, 30), (40, 41)]) == [(0, 8), (10, 30), (40, 41)]
+    assert merge([]) == []
+
+
+def test_contains_needs_one_span_covering_the_range():
+    spans = [(0, 8), (10, 30)]
+    assert contains(spans, 10, 30)
+    assert contains(spans, 0, 1)
+    assert not contains(spans, 5, 12)  # across a hole
+    assert not contains(spans, 29, 31)
+    assert not contains(spans, 30, 31)
+    assert not contains([], 0, 1)
+
+
+def test_subtract_leaves_the_uncovered_parts():
+    assert subtract([(0, 100)], [(10, 20), (50, 60)]) == [(0, 10), (20, 50), (60, 100)]
+    assert subtract([(0, 10), (20, 30)], [(5, 25)]) == [(0, 5), (25, 30)]
+    assert subtract([(0, 10)], [(0, 10)]) == []
+    assert subtract([(0, 10)], []) == [(0, 10)]
+
+
+def test_compare_reports_missing_entries_and_unknown_spans():
+    register_map = load_map(DEFAULT_MODEL)
+    spans = [(addr, addr + nb) for _, reg_type, addr, nb in register_map.entries() if reg_type == RegisterType.INPUT]
+    hole = spans[0]
+    discovered = {RegisterType.INPUT: subtract(merge(spans + [(9000, 9010)]), [hole])}
+
+    missing, unknown = compare(discovered, register_map)
+
+    expected = [(name, socket, reg_type, addr, nb) for (name, socket), reg_type, addr, nb in register_map.entries()
+                if reg_type == RegisterType.INPUT and addr < hole[1] and addr + nb > hole[0]]
+    assert missing == expected
+    assert unknown == {RegisterType.INPUT: [(9000, 9010)]}
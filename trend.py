@@ -0,0 +1,187 @@
+from array import array
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+ENVELOPE_BUCKETS = 2048
+REPAINT_INTERVAL_MS = 200
+MODE_MINMAX = "minmax"
+MODE_LTTB = "lttb"
+
+SERIES_COLORS = ("#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f")
+
+
+def lttb(times, values, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the visual shape with `threshold` points
+    n = len(times)
+    if threshold >= n or threshold < 3:
+        return list(times), list(values)
+    out_t, out_v = [times[0]], [values[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_t = sum(times[next_start:next_end]) / (next_end - next_start)
+        avg_v = sum(values[next_start:next_end]) / (next_end - next_start)
+        ta, va = times[a], values[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ta - avg_t) * (values[j] - va) - (ta - times[j]) * (avg_v - va))
+            if area > best_area:
+                best, best_area = j, area
+        out_t.append(times[best])
+        out_v.append(values[best])
+        a = best
+    out_t.append(times[-1])
+    out_v.append(values[-1])
+    return out_t, out_v
+
+
+def minmax_downsample(times, lows, highs, t0, t1, width):
+    # One (min, max) pair per pixel column between t0 and t1; pass the same values
+    # as lows and highs for raw samples
+    columns = {}
+    x_scale = (width - 1) / ((t1 - t0) or 1.0)
+    for t, low, high in zip(times, lows, highs):
+        x = int((t - t0) * x_scale)
+        if 0 <= x < width:
+            column = columns.get(x)
+            columns[x] = (low, high) if column is None else (min(column[0], low), max(column[1], high))
+    return sorted((x, low, high) for x, (low, high) in columns.items())
+
+
+class SeriesEnvelope:
+    # Fixed number of min/max/mean buckets; when time runs past the last bucket,
+    # neighbouring buckets are merged and the bucket width doubles, so appends stay O(1)
+    def __init__(self, start: float, bucket_width: float = 0.25, buckets: int = ENVELOPE_BUCKETS):
+        self.start = start
+        self.bucket_width = bucket_width
+        self.buckets = buckets
+        self.mins = array("d")
+        self.maxs = array("d")
+        self.sums = array("d")
+        self.counts = array("l")
+
+    def __len__(self):
+        return len(self.counts)
+
+    def append(self, t: float, v: float):
+        index = int((t - self.start) / self.bucket_width)
+        if index < 0:
+            return
+        while index >= self.buckets:
+            self._halve()
+            index = int((t - self.start) / self.bucket_width)
+        while len(self.counts) <= index:
+            self.mins.append(float("inf"))
+            self.maxs.append(float("-inf"))
+            self.sums.append(0.0)
+            self.counts.append(0)
+        if v < self.mins[index]:
+            self.mins[index] = v
+        if v > self.maxs[index]:
+            self.maxs[index] = v
+        self.sums[index] += v
+        self.counts[index] += 1
+
+    def _halve(self):
+        mins, maxs, sums, counts = array("d"), array("d"), array("d"), array("l")
+        for i in range(0, len(self.counts), 2):
+            j = min(i + 1, len(self.counts) - 1)
+            mins.append(min(self.mins[i], self.mins[j]))
+            maxs.append(max(self.maxs[i], self.maxs[j]))
+            sums.append(self.sums[i] + (self.sums[j] if j != i else 0.0))
+            counts.append(self.counts[i] + (self.counts[j] if j != i else 0))
+        self.mins, self.maxs, self.sums, self.counts = mins, maxs, sums, counts
+        self.bucket_width *= 2
+
+    def points(self):
+        # (time, min, max, mean) for every non-empty bucket
+        for i, n in enumerate(self.counts):
+            if n:
+                yield self.start + (i + 0.5) * self.bucket_width, self.mins[i], self.maxs[i], self.sums[i] / n
+
+    def end(self):
+        return self.start + len(self.counts) * self.bucket_width
+
+
+class TrendWidget(QtWidgets.QWidget):
+    def __init__(self, parent=None, mode: str = MODE_MINMAX):
+        super().__init__(parent)
+        self.mode = mode
+        self.series = {}  # name -> SeriesEnvelope
+        self.colors = {}
+        self.visible = set()
+        self._dirty = False
+        self._repaint_timer = QtCore.QTimer(self)
+        self._repaint_timer.timeout.connect(self._repaint_if_dirty)
+        self._repaint_timer.start(REPAINT_INTERVAL_MS)
+        self.setMinimumHeight(120)
+
+    def add_series(self, name):
+        if name not in self.colors:
+            self.colors[name] = QtGui.QColor(SERIES_COLORS[len(self.colors) % len(SERIES_COLORS)])
+        self.visible.add(name)
+        self._dirty = True
+
+    def set_visible(self, name, visible):
+        if visible:
+            self.add_series(name)
+        else:
+            self.visible.discard(name)
+        self._dirty = True
+
+    def append(self, name, t, v):
+        envelope = self.series.get(name)
+        if envelope is None:
+            envelope = self.series[name] = SeriesEnvelope(t)
+        envelope.append(t, v)
+        if name in self.visible:
+            self._dirty = True
+
+    def load(self, name, times, values):
+        for t, v in zip(times, values):
+            self.append(name, t, v)
+
+    def clear(self):
+        self.series.clear()
+        self._dirty = True
+
+    def _repaint_if_dirty(self):
+        if self._dirty and self.isVisible():
+            self._dirty = False
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.white)
+        shown = [name for name in self.visible if name in self.series and len(self.series[name])]
+        if not shown:
+            painter.end()
+            return
+        t0 = min(self.series[name].start for name in shown)
+        t1 = max(self.series[name].end() for name in shown)
+        lo = min(min(v for _, v, _, _ in self.series[name].points()) for name in shown)
+        hi = max(max(v for _, _, v, _ in self.series[name].points()) for name in shown)
+        width, height = self.width(), self.height()
+        x_scale = (width - 1) / ((t1 - t0) or 1.0)
+        y_scale = (height - 1) / ((hi - lo) or 1.0)
+
+        for name in shown:
+            painter.setPen(QtGui.QPen(self.colors[name], 1))
+            points = list(self.series[name].points())
+            if self.mode == MODE_LTTB:
+                times, values = lttb([p[0] for p in points], [p[3] for p in points], width)
+                line = QtGui.QPolygonF([
+                    QtCore.QPointF((t - t0) * x_scale, height - 1 - (v - lo) * y_scale)
+                    for t, v in zip(times, values)
+                ])
+                painter.drawPolyline(line)
+            else:
+                columns = minmax_downsample([p[0] for p in points], [p[1] for p in points],
+                                            [p[2] for p in points], t0, t1, width)
+                for x, low, high in columns:
+                    painter.drawLine(QtCore.QLineF(x, height - 1 - (low - lo) * y_scale,
+                                                   x, height - 1 - (high - lo) * y_scale))
+        painter.end()
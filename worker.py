@@ -0,0 +1,263 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot, qDebug
+
+from read_planner import plan_reads
+from reconnect import CONNECTED, RECONNECTING
+from registers import DEFAULT_MODEL, DataType, RegisterDef, RegisterType, convert_from, convert_to, load_map
+from scheduler import PollScheduler
+
+MIN_READ_DELAY_MS = 10
+
+
+def format_sockets(reg, read_data, read_data2=None, word_order="big"):
+    if not read_data:
+        return "N/A"
+    text = convert_to(reg.data_type, list(read_data), word_order)
+
+    if (
+        isinstance(read_data2, list)
+        and len(read_data2) > 0
+        and (
+            reg.data_type != DataType.STRING or any(x != 0 for x in read_data2)
+        )
+    ):
+        text2 = convert_to(reg.data_type, list(read_data2), word_order)
+        if isinstance(text2, str) and text2.strip():
+            text = f"Socket 1: {text} | Socket 2: {text2}"
+    return text
+
+
+class ModbusWorker(QObject):
+    # Lives in its own QThread; results reach the widgets through queued signals
+    connection_changed = pyqtSignal(bool)
+    value_read = pyqtSignal(str, str)
+    values_read = pyqtSignal(dict)
+    reading_stopped = pyqtSignal()
+    watch_stopped = pyqtSignal(str)
+    write_done = pyqtSignal(str, bool)
+    connection_state = pyqtSignal(str, str)  # reconnect.* state, detail
+
+    def __init__(self, controller):
+        super().__init__()
+        self.c = controller
+        self.register_map = load_map(DEFAULT_MODEL)
+        self.c.unit = self.register_map.unit
+        self.register_name = None
+        self.reading = False
+        self.watches = {}  # tag -> register names polled for the dashboard, trend plots, ...
+        self.scheduler = None
+        self._read_timer = QTimer(self)
+        self._read_timer.setSingleShot(True)
+        self._read_timer.timeout.connect(self.read_once)
+        if hasattr(controller, "add_state_listener"):
+            # Emitted from the controller's threads, delivered queued in this thread
+            controller.add_state_listener(self.connection_state.emit)
+            self.connection_state.connect(self.state_changed)
+
+    def get_register(self, text):
+        return self.register_map[text]
+
+    @pyqtSlot(str, int, int)
+    def connect_device(self, host, port, timeout):
+        try:
+            result = bool(self.c.connect(host, port, timeout))
+        except Exception as e:
+            qDebug(str(e))
+            result = False
+        self.connection_changed.emit(result)
+
+    @pyqtSlot()
+    def disconnect_device(self):
+        self.stop_all()
+        try:
+            self.c.disconnect()
+        except Exception as e:
+            qDebug(str(e))
+        self.connection_changed.emit(False)
+
+    @pyqtSlot(str, str)
+    def state_changed(self, state, detail):
+        if state == CONNECTED and self.scheduler is not None:
+            # Back after a reconnect: everything is due again
+            self.scheduler.reset()
+            self._read_timer.start(0)
+
+    @pyqtSlot()
+    def refresh(self):
+        self.c.refresh()
+        if self.scheduler is not None:
+            self.scheduler.reset()
+            self._read_timer.start(0)
+
+    @pyqtSlot(bool)
+    def set_evc10(self, evc10):
+        self.register_map = load_map("EVC10" if evc10 else DEFAULT_MODEL)
+        self.c.unit = self.register_map.unit
+        self.reschedule()
+
+    def make_scheduler(self, names):
+        return PollScheduler({name: self.get_register(name).poll_interval for name in names})
+
+    def reschedule(self):
+        # One scheduler covers the Read tab selection and every active watch
+        names = []
+        for watched in self.watches.values():
+            names.extend(name for name in watched if name not in names)
+        if self.reading and self.register_name not in names:
+            names.append(self.register_name)
+        if not names:
+            self._read_timer.stop()
+            self.scheduler = None
+            return
+        self.scheduler = self.make_scheduler(names)
+        self._read_timer.start(0)
+
+    @pyqtSlot(str)
+    def set_register(self, name):
+        self.register_name = name
+        if self.reading:
+            self.reschedule()
+
+    @pyqtSlot(str)
+    def start_reading(self, name):
+        self.register_name = name
+        self.reading = True
+        self.reschedule()
+
+    @pyqtSlot()
+    def stop_reading(self):
+        self.reading = False
+        self.reschedule()
+        self.reading_stopped.emit()
+
+    @pyqtSlot(str, list)
+    def watch(self, tag, names):
+        self.watches[tag] = [name for name in names if name in self.register_map.by_name]
+        self.reschedule()
+
+    @pyqtSlot(str)
+    def unwatch(self, tag):
+        self.watches.pop(tag, None)
+        self.reschedule()
+        self.watch_stopped.emit(tag)
+
+    def stop_all(self):
+        tags, self.watches = list(self.watches), {}
+        self.stop_reading()
+        for tag in tags:
+            self.watch_stopped.emit(tag)
+
+    @pyqtSlot()
+    def read_once(self):
+        if self.scheduler is None:
+            return
+        try:
+            if getattr(self.c, "state", None) == RECONNECTING:
+                # Paused until state_changed reports the link is back
+                return
+            if not self.c.is_connected():
+                self.stop_all()
+                return
+            due = self.scheduler.due()
+            if due:
+                started = time.monotonic()
+                read_data = self.read_words(due)
+                self.scheduler.complete({name: (name, 1) in read_data for name in due},
+                                        time.monotonic() - started)
+                self.publish(due, read_data)
+        except Exception as e:
+            qDebug(str(e))
+            self.stop_all()
+            return
+        delay = self.scheduler.next_wakeup()
+        if delay is not None:
+            self._read_timer.start(max(int(delay * 1000), MIN_READ_DELAY_MS))
+
+    def publish(self, names, read_data):
+        self.values_read.emit({
+            key: convert_to(self.get_register(key[0]).data_type, words, self.register_map.word_order)
+            for key, words in read_data.items()
+        })
+        name = self.register_name
+        if self.reading and name in names:
+            reg = self.get_register(name)
+            self.value_read.emit(name, format_sockets(reg, read_data.get((name, 1)), read_data.get((name, 2)),
+                                                      self.register_map.word_order))
+
+    @pyqtSlot(str, int)
+    def write_value(self, name, data):
+        try:
+            self.write_register(self.get_register(name), data)
+            self.write_done.emit(name, True)
+        except Exception as e:
+            qDebug(str(e))
+            self.write_done.emit(name, False)
+
+    @pyqtSlot(dict)
+    def write_values(self, values):
+        # {name: value}; adjacent holding registers go out in one request
+        try:
+            writes = {}
+            for name, data in values.items():
+                reg = self.get_register(name)
+                writes[reg.addr] = convert_from(reg.data_type, reg.nb, data, self.register_map.word_order)
+            self.c.write_batch(writes)
+            ok = True
+        except Exception as e:
+            qDebug(str(e))
+            ok = False
+        for name in values:
+            self.write_done.emit(name, ok)
+
+    def read_block(self, block):
+        if block.reg_type == RegisterType.INPUT:
+            data = self.c.read_input(block.addr, block.nb)
+        else:
+            data = self.c.read_holding(block.addr, block.nb)
+        if not data or len(data) < block.nb:
+            return None
+        return list(data)
+
+    def read_words(self, names):
+        # Adjacent registers of the same type are fetched with one PDU and sliced afterwards
+        # Static registers are served from the controller cache when possible
+        read_data = {}
+        misses = []
+        for entry in self.register_map.entries(names):
+            key, reg_type, addr, nb = entry
+            cached = self.c.cache.get((reg_type, addr, nb))
+            if cached is not None:
+                read_data[key] = cached
+            else:
+                misses.append(entry)
+
+        blocks = plan_reads(misses) if read_data else self.register_map.plan(names)
+        if getattr(self.c, "window", 1) > 1:
+            # Every block in flight at once, e.g. socket 1 and socket 2 of an EVC10
+            block_data = self.c.read_blocks(blocks)
+        else:
+            block_data = [self.read_block(block) for block in blocks]
+        for block, data in zip(blocks, block_data):
+            if data is None:
+                continue
+            data = list(data)
+            for key, addr, nb in block.entries:
+                words = block.slice(data, addr, nb)
+                read_data[key] = words
+                self.c.cache.put((block.reg_type, addr, nb), words, self.get_register(key[0]).cache_ttl)
+        return read_data
+
+    def read_registers(self, names):
+        read_data = self.read_words(names)
+        return {
+            name: format_sockets(self.get_register(name), read_data.get((name, 1)), read_data.get((name, 2)),
+                                 self.register_map.word_order)
+            for name in names
+        }
+
+    def write_register(self, reg: RegisterDef, data):
+        if reg.data_type == DataType.UINT16 and reg.nb == 1:
+            self.c.write(reg.addr, data)
+        else:
+            self.c.write_many(reg.addr, convert_from(reg.data_type, reg.nb, data, self.register_map.word_order))